@@ -0,0 +1,166 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Expectimax player over packed engine boards. Rows are scored through
+# a lazily filled heuristic table, searched positions are kept in an LRU
+# transposition table and the search deepens until the time budget ends.
+
+
+# import standard
+import time
+from collections import OrderedDict, namedtuple
+
+# import local
+import engine
+
+# heuristic weights
+LOST_PENALTY = 200000.0
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+MERGES_WEIGHT = 700.0
+EMPTY_WEIGHT = 270.0
+
+# chance nodes below this probability are evaluated instead of expanded
+PROBABILITY_CUTOFF = 0.0001
+DEADLINE_CHECK = 255                                 # nodes between clock reads
+
+Decision = namedtuple("Decision", "board direction depth nodes lookups hits elapsed")
+
+
+class _Timeout(Exception):
+    pass
+
+
+class _HeuristicTable(engine.LazyTable):
+    # row -> heuristic value
+
+    def compute(self, row):
+        cells = self.rules.unpack_row(row)
+        empty = cells.count(0)
+        merges, previous, counter = 0, 0, 0
+        for exponent in cells:
+            if not exponent:
+                continue
+            if exponent == previous:
+                counter += 1
+            elif counter:
+                merges += 1 + counter
+                counter = 0
+            previous = exponent
+        if counter:
+            merges += 1 + counter
+        left = right = 0.0
+        for index in range(1, len(cells)):
+            a = cells[index - 1] ** MONOTONICITY_POWER
+            b = cells[index] ** MONOTONICITY_POWER
+            if cells[index - 1] > cells[index]:
+                left += a - b
+            else:
+                right += b - a
+        total = sum(exponent ** SUM_POWER for exponent in cells)
+        return (LOST_PENALTY + EMPTY_WEIGHT * empty + MERGES_WEIGHT * merges
+                - MONOTONICITY_WEIGHT * min(left, right) - SUM_WEIGHT * total)
+
+
+class Searcher:
+
+    def __init__(self, grid=4, cache_size=200000, max_depth=8, compact=True):
+        self.rules = engine.Rules.for_grid(grid, compact)  # move tables
+        self.heuristic = _HeuristicTable(self.rules)  # row scores
+        self.cache = OrderedDict()                   # board -> (depth, value)
+        self.cache_size = cache_size                 # transposition table capacity
+        self.max_depth = max_depth                   # iterative deepening limit
+        self.deadline = None                         # perf_counter() time to give up
+        self.nodes = 0                               # evaluated nodes of the last search
+        self.lookups = 0                             # transposition table lookups
+        self.hits = 0                                # transposition table hits
+
+    def evaluate(self, board):
+        rules, heuristic = self.rules, self.heuristic
+        row_bits, row_mask = rules.row_bits, rules.row_mask
+        transposed = rules.transpose(board)
+        res = 0.0
+        for row in range(rules.grid):
+            shift = row * row_bits
+            res += heuristic[(board >> shift) & row_mask] + heuristic[(transposed >> shift) & row_mask]
+        return res
+
+    def tick(self):
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & DEADLINE_CHECK and time.perf_counter() > self.deadline:
+            raise _Timeout()
+
+    def chance(self, board, depth, probability):
+        self.tick()
+        if depth <= 0 or probability < PROBABILITY_CUTOFF:
+            return self.evaluate(board)
+        self.lookups += 1
+        entry = self.cache.get(board)
+        if entry is not None and entry[0] >= depth:
+            self.hits += 1
+            self.cache.move_to_end(board)
+            return entry[1]
+        rules = self.rules
+        empty = rules.empty_cells(board)
+        probability /= len(empty)
+        res = 0.0
+        for index in empty:
+            res += 0.9 * self.best(rules.put(board, index, 1), depth, probability * 0.9)
+            res += 0.1 * self.best(rules.put(board, index, 2), depth, probability * 0.1)
+        res /= len(empty)
+        self.cache[board] = (depth, res)
+        self.cache.move_to_end(board)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return res
+
+    def best(self, board, depth, probability):
+        self.tick()
+        res = 0.0
+        for direction in engine.DIRECTIONS:
+            moved, score = self.rules.move(board, direction)
+            if moved != board:
+                res = max(res, self.chance(moved, depth - 1, probability))
+        return res
+
+    def root(self, board, depth):
+        res, value = None, 0.0
+        for direction in engine.DIRECTIONS:
+            moved, score = self.rules.move(board, direction)
+            if moved != board:
+                current = self.chance(moved, depth - 1, 1.0)
+                if res is None or current > value:
+                    res, value = direction, current
+        return res
+
+    def decide(self, board, budget=None, depth=None):
+        # best direction under a millisecond budget or at a fixed depth
+        start_time = time.perf_counter()
+        self.nodes = self.lookups = self.hits = 0
+        self.deadline = start_time + budget / 1000.0 if budget else None
+        res, reached = None, 0
+        try:
+            for current in range(1, (depth or self.max_depth) + 1):
+                res, reached = self.root(board, current), current
+                if res is None:
+                    break
+        except _Timeout:
+            self.deadline = None
+            if res is None:
+                # even depth one did not fit, fall back to the heuristic alone
+                res = self.root(board, 0)
+        self.deadline = None
+        return Decision(board, res, reached, self.nodes, self.lookups, self.hits,
+                        time.perf_counter() - start_time)
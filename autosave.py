@@ -0,0 +1,118 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Game state file. The GUI thread hands over a packed snapshot (header plus
+# one exponent byte per cell) after every change; a writer thread stores
+# only the latest one, once enough moves have piled up or the interval since
+# the first unsaved change has passed. Files are replaced atomically, so a
+# crash leaves either the old state or the new one.
+
+
+# import standard
+import os
+import sys
+import time
+import struct
+import threading
+from collections import namedtuple
+
+STATE = struct.Struct("<4sHQQQQQd")                  # magic, grid resolution, score, highscore, seed, draws,
+                                                     # moves, seconds played
+MAGIC = b"SAV2"
+
+State = namedtuple("State", "board score highscore seed draws moves played")
+
+
+class Autosave:
+
+    def __init__(self, path, rules, interval=2.0, moves=20):
+        self.path = path
+        self.rules = rules
+        self.interval = interval                     # seconds an unsaved change may wait
+        self.moves = moves                           # changes that force a write
+        self.condition = threading.Condition()
+        self.pending = None                          # latest unsaved snapshot
+        self.since = 0.0                             # monotonic time of the first unsaved change
+        self.count = 0                               # changes since the last write
+        self.closing = False
+        self.thread = threading.Thread(target=self.write, daemon=True)
+        self.thread.start()
+
+    def load(self):
+        # a State, its board is None when the grid differs; None without a valid file
+        try:
+            with open(self.path, "rb") as source:
+                data = source.read()
+        except OSError:
+            return None
+        if len(data) < STATE.size:
+            return None
+        magic, grid, score, highscore, seed, draws, moves, played = STATE.unpack_from(data)
+        if magic != MAGIC:
+            return None
+        if grid != self.rules.grid or len(data) != STATE.size + self.rules.size:
+            return State(None, score, highscore, seed, draws, moves, played)
+        try:
+            return State(self.rules.pack(data[STATE.size:]), score, highscore, seed, draws, moves, played)
+        except ValueError:
+            return None
+
+    def update(self, board, score, highscore, seed, draws, moves, played):
+        # called on the GUI thread, only packs the snapshot
+        data = STATE.pack(MAGIC, self.rules.grid, score, highscore, seed, draws, moves, played) + \
+            bytes(self.rules.unpack(board))
+        with self.condition:
+            if self.pending is None:
+                # the writer sleeps until something is pending, start its timed wait
+                self.since = time.monotonic()
+                self.condition.notify()
+            self.pending = data
+            self.count += 1
+            if self.count >= self.moves:
+                self.condition.notify()
+
+    def close(self):
+        # store what is pending and stop the writer
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join()
+
+    # writer thread
+
+    def write(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.pending is not None:
+                        remaining = self.since + self.interval - time.monotonic()
+                        if self.closing or self.count >= self.moves or remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    elif self.closing:
+                        return
+                    else:
+                        self.condition.wait()
+                data, self.pending, self.count = self.pending, None, 0
+            self.store(data)
+
+    def store(self, data):
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "wb") as target:
+                target.write(data)
+                target.flush()
+                os.fsync(target.fileno())
+            os.replace(temporary, self.path)
+        except OSError as error:
+            sys.stderr.write("autosave: %s\n" % error)
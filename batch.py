@@ -0,0 +1,180 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Vectorized engine that advances many boards in lockstep. Boards are an
+# (N, grid, grid) uint8 array of log2 exponents (0 for an empty cell),
+# moves an (N,) array of engine directions. The only Python loops run over
+# the four directions and the cells of a line, never over the boards.
+# Needs NumPy, which the game itself does not.
+
+
+# import standard
+import sys
+import time
+import json
+import argparse
+
+# import third-party
+import numpy as np
+
+# import local
+import engine
+
+
+def _rules(grid):
+    # the wide-cell rules the window and the server play by, not the compact 4x4 ones
+    return engine.Rules.for_grid(grid, compact=False)
+
+
+def _slide_left(rows, limit):
+    # slide (M, grid) lines towards column 0, every tile merges at most once
+    order = np.argsort(rows == 0, axis=1, kind="stable")
+    rows = np.take_along_axis(rows, order, axis=1)
+    score = np.zeros(len(rows), dtype=np.int64)
+    for column in range(rows.shape[1] - 1):
+        current, following = rows[:, column], rows[:, column + 1]
+        hit = (current != 0) & (current == following) & (current < limit)
+        current[hit] += 1
+        following[hit] = 0
+        score[hit] += np.left_shift(1, current[hit].astype(np.int64))
+    order = np.argsort(rows == 0, axis=1, kind="stable")
+    return np.take_along_axis(rows, order, axis=1), score
+
+
+def _orient(boards, direction):
+    # view that turns 'direction' into a move to the left
+    if direction == engine.RIGHT:
+        return boards[:, :, ::-1]
+    if direction == engine.UP:
+        return boards.transpose(0, 2, 1)
+    if direction == engine.DOWN:
+        return boards.transpose(0, 2, 1)[:, :, ::-1]
+    return boards
+
+
+def _restore(boards, direction):
+    if direction == engine.DOWN:
+        return boards[:, :, ::-1].transpose(0, 2, 1)
+    return _orient(boards, direction)
+
+
+def game_over(boards):
+    # no empty cell and no equal neighbours below the limit, as in Rules.can_move
+    limit = _rules(boards.shape[1]).limit
+    full = (boards != 0).all(axis=(1, 2))
+    mergeable = boards < limit
+    horizontal = ((boards[:, :, 1:] == boards[:, :, :-1]) & mergeable[:, :, 1:]).any(axis=(1, 2))
+    vertical = ((boards[:, 1:, :] == boards[:, :-1, :]) & mergeable[:, 1:, :]).any(axis=(1, 2))
+    return full & ~horizontal & ~vertical
+
+
+def move(boards, moves):
+    # returns (new boards, score deltas, moved mask, game over mask)
+    boards = np.asarray(boards, dtype=np.uint8)
+    moves = np.asarray(moves)
+    count, grid = boards.shape[0], boards.shape[1]
+    limit = _rules(grid).limit
+    res = boards.copy()
+    scores = np.zeros(count, dtype=np.int64)
+    for direction in engine.DIRECTIONS:
+        selected = np.flatnonzero(moves == direction)
+        if not len(selected):
+            continue
+        lines = np.ascontiguousarray(_orient(boards[selected], direction)).reshape(-1, grid)
+        lines, score = _slide_left(lines, limit)
+        res[selected] = _restore(lines.reshape(-1, grid, grid), direction)
+        scores[selected] = score.reshape(-1, grid).sum(axis=1)
+    moved = (res != boards).any(axis=(1, 2))
+    return res, scores, moved, game_over(res)
+
+
+def spawn(boards, rng, mask=None):
+    # put a 2 (or a 4 in ~10% of cases) into a random empty cell of every masked board
+    boards = np.array(boards, dtype=np.uint8)
+    count, grid = boards.shape[0], boards.shape[1]
+    flat = boards.reshape(count, grid * grid)
+    empty = flat == 0
+    keys = rng.random(flat.shape)
+    keys[~empty] = -1.0
+    cells = keys.argmax(axis=1)
+    exponents = np.where(rng.integers(0, 99, count) > 89, 2, 1).astype(np.uint8)
+    selected = empty.any(axis=1)
+    if mask is not None:
+        selected &= mask
+    rows = np.flatnonzero(selected)
+    flat[rows, cells[rows]] = exponents[rows]
+    return boards
+
+
+def step(boards, moves, rng):
+    # move, spawn where the move did something, then check for game over
+    res, scores, moved, over = move(boards, moves)
+    res = spawn(res, rng, moved)
+    return res, scores, moved, game_over(res)
+
+
+def new_boards(count, grid, rng):
+    return spawn(np.zeros((count, grid, grid), dtype=np.uint8), rng)
+
+
+def check(grids=(4, 5, 6, 7, 8), count=2000, seed=0):
+    # cross-check against the scalar engine on random boards
+    rng = np.random.default_rng(seed)
+    for grid in grids:
+        rules = _rules(grid)
+        boards = rng.integers(0, 6, (count, grid, grid)).astype(np.uint8)
+        boards[rng.random(boards.shape) < 0.3] = 0
+        # full boards of rarely equal tiles, many at the limit where merges stop;
+        # merges stay below 2^41 so that scores fit int64 on the wide grids
+        full = boards[:count // 4]
+        full[...] = rng.integers(1, min(rules.limit, 40) + 1, full.shape)
+        full[rng.random(full.shape) < 0.2] = rules.limit
+        moves = rng.integers(0, 4, count)
+        res, scores, moved, over = move(boards, moves)
+        for index in range(count):
+            board = rules.pack(boards[index].ravel().tolist())
+            expected, score = rules.move(board, int(moves[index]))
+            if rules.unpack(expected) != res[index].ravel().tolist() or score != scores[index] \
+                    or (expected != board) != moved[index] or rules.can_move(expected) == over[index]:
+                raise AssertionError("grid %d, board %d differs from the scalar engine" % (grid, index))
+    return True
+
+
+def benchmark(grids=(4, 5, 6, 7, 8), count=10000, rounds=20, seed=0):
+    rng = np.random.default_rng(seed)
+    res = []
+    for grid in grids:
+        boards = new_boards(count, grid, rng)
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            boards, scores, moved, over = step(boards, rng.integers(0, 4, count), rng)
+            if over.any():
+                boards[over] = new_boards(int(over.sum()), grid, rng)
+        elapsed = time.perf_counter() - start_time
+        res.append({"grid": grid, "boards": count, "rounds": rounds, "boards_per_sec": count * rounds / elapsed})
+    return res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="vectorized 2048 engine")
+    parser.add_argument("--check", action="store_true", help="compare with the scalar engine")
+    parser.add_argument("--bench", action="store_true", help="measure boards/sec for grids 4-8")
+    parser.add_argument("--boards", type=int, default=10000, help="boards per benchmark batch")
+    args = parser.parse_args()
+    if args.check:
+        check()
+        print(json.dumps({"check": "ok"}))
+    if args.bench or not args.check:
+        for line in benchmark(count=args.boards):
+            print(json.dumps(line))
+    sys.exit(0)
@@ -0,0 +1,35 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+
+# import standard
+import time
+
+
+def measure(function, repeat):
+    # seconds taken by every call
+    res = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        res.append(time.perf_counter() - start_time)
+    return res
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    return {"n": len(ordered),
+            "mean_ms": 1000 * sum(ordered) / len(ordered),
+            "p50_ms": 1000 * ordered[len(ordered) // 2],
+            "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+            "min_ms": 1000 * ordered[0]}
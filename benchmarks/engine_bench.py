@@ -0,0 +1,63 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Qt-free hot paths: packed board moves and the transpose that replaced
+# the Matrix rotations.
+
+
+# import standard
+import random
+
+# import local
+import engine
+from common import measure, summary
+
+
+def random_board(rules, rng):
+    return rules.pack([rng.choice((0, 0, 1, 1, 2, 3, 4, 5)) for _ in range(rules.size)])
+
+
+def run(grids, repeat):
+    res = {}
+    rng = random.Random(0)
+    for grid in grids:
+        rules = engine.Rules.for_grid(grid)
+        boards = [random_board(rules, rng) for _ in range(256)]
+        # warm the lazily filled row tables first
+        for board in boards:
+            for direction in engine.DIRECTIONS:
+                rules.move(board, direction)
+
+        def moves():
+            for board in boards:
+                for direction in engine.DIRECTIONS:
+                    rules.move(board, direction)
+
+        def transposes():
+            for board in boards:
+                rules.transpose(board)
+
+        def game_over():
+            for board in boards:
+                rules.can_move(board)
+
+        def checks():
+            for board in boards:
+                rules.check(board)
+
+        per_call = 4 * len(boards)
+        res["engine.move[%d]" % grid] = summary([sample / per_call for sample in measure(moves, repeat)])
+        res["engine.transpose[%d]" % grid] = summary([sample / len(boards) for sample in measure(transposes, repeat)])
+        res["engine.can_move[%d]" % grid] = summary([sample / len(boards) for sample in measure(game_over, repeat)])
+        res["engine.check[%d]" % grid] = summary([sample / len(boards) for sample in measure(checks, repeat)])
+    return res
@@ -0,0 +1,161 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Widget paths measured on Qt's offscreen platform. The runner imports
+# 'game' from a scratch directory, so saves and journals land there.
+
+
+# import standard
+import time
+
+# import third-party
+from PyQt5 import QtGui, QtCore
+
+# import local
+import engine
+from common import measure, summary
+
+
+def window(game, grid):
+    game.settings.set("grid", grid)
+    game.settings.set("save", [])
+    main = game.Main()
+    main.start()
+    main.journal.sync()
+    return main
+
+
+def close(main):
+    main.journal.close()
+    main.autosave.close()
+    main.stats.close()
+    main.deleteLater()
+
+
+def moves(game, grid, repeat):
+    # Matrix.merge, then collect + spawn + check_state settled from the animation
+    main = window(game, grid)
+    merge, settle = [], []
+    directions = [engine.LEFT, engine.UP, engine.RIGHT, engine.DOWN]
+    while len(merge) < repeat:
+        for direction in directions:
+            start_time = time.perf_counter()
+            main.matrix.merge(direction)
+            middle_time = time.perf_counter()
+            if main.matrix.modified:
+                main.matrix.finish()
+                merge.append(middle_time - start_time)
+                settle.append(time.perf_counter() - middle_time)
+                main.matrix.modified = False
+        if main.state == "lose":
+            main.new_game()
+    close(main)
+    return summary(merge), summary(settle), summary([a + b for a, b in zip(merge, settle)])
+
+
+def lines(game, grid, repeat):
+    main = window(game, grid)
+    res = summary(measure(main.matrix.build_lines, repeat))
+    close(main)
+    return res
+
+
+def paint(game, grid, scales, repeat):
+    # full canvas frames rendered into an image
+    main = window(game, grid)
+    for _ in range(grid * grid // 2):
+        main.matrix.spawn()
+    main.matrix.finish()
+    res = {}
+    for sf in scales:
+        main.canvas.resize(int(210 * sf), int(320 * sf))
+        image = QtGui.QImage(main.canvas.size(), QtGui.QImage.Format_ARGB32_Premultiplied)
+        res[sf] = summary(measure(lambda: main.canvas.render(image), repeat))
+    close(main)
+    return res
+
+
+def fill(game, grid, repeat):
+    main = window(game, grid)
+    values = [2 ** (index % 11 + 1) for index in range(grid * grid)]
+
+    def load():
+        main.matrix.fill(values)
+        main.matrix.update()
+
+    res = summary(measure(load, repeat))
+    close(main)
+    return res
+
+
+def replay(game, grid, repeat):
+    # R and back: journal reread, seek to the last move, return to the live board
+    main = window(game, grid)
+    for index in range(64):
+        main.queue.append(engine.DIRECTIONS[index % 4])
+        main.next_move()
+        main.matrix.finish()
+        if main.state == "lose":
+            break
+
+    def enter():
+        main.enter_replay()
+        main.leave_replay()
+
+    res = summary(measure(enter, repeat))
+    close(main)
+    return res
+
+
+def startup(game, grid, repeat):
+    # window construction plus the deferred save restore
+    samples = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        main = window(game, grid)
+        samples.append(time.perf_counter() - start_time)
+        close(main)
+    return summary(samples)
+
+
+def save(game, grid, repeat):
+    samples = []
+    for _ in range(repeat):
+        main = window(game, grid)
+        main.matrix.spawn()
+        main.matrix.finish()
+        start_time = time.perf_counter()
+        main.closeEvent(QtGui.QCloseEvent())
+        samples.append(time.perf_counter() - start_time)
+        main.deleteLater()
+    return summary(samples)
+
+
+def run(game, grids, scales, repeat):
+    res = {}
+    for grid in grids:
+        merge, settle, total = moves(game, grid, repeat)
+        res["matrix.merge[%d]" % grid] = merge
+        res["matrix.collect_spawn[%d]" % grid] = settle
+        res["matrix.move[%d]" % grid] = total
+        res["matrix.lines[%d]" % grid] = lines(game, grid, repeat)
+        res["matrix.fill[%d]" % grid] = fill(game, grid, max(1, repeat // 4))
+    for sf, stats in paint(game, 4, scales, repeat).items():
+        res["canvas.paint[4@%gx]" % sf] = stats
+    for sf, stats in paint(game, max(grids), scales, max(1, repeat // 4)).items():
+        res["canvas.paint[%d@%gx]" % (max(grids), sf)] = stats
+    res["main.replay[4]"] = replay(game, 4, max(1, repeat // 4))
+    res["main.startup[4]"] = startup(game, 4, max(1, repeat // 20))
+    res["main.close_save[4]"] = save(game, 4, max(1, repeat // 20))
+    QtCore.QCoreApplication.processEvents()
+    return res
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Benchmark runner. Prints one JSON document with timings of every hot
+# path, optionally compared with a stored baseline:
+#
+#     python3 benchmarks/run.py --save baseline.json
+#     python3 benchmarks/run.py --baseline baseline.json
+
+
+# import standard
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def compare(results, baseline, tolerance):
+    # metrics whose mean got slower than the baseline by more than 'tolerance'
+    res = []
+    for name, stats in sorted(results.items()):
+        if name in baseline and stats["mean_ms"] > baseline[name]["mean_ms"] * (1 + tolerance):
+            res.append({"name": name,
+                        "baseline_ms": baseline[name]["mean_ms"],
+                        "current_ms": stats["mean_ms"],
+                        "ratio": stats["mean_ms"] / baseline[name]["mean_ms"]})
+    return res
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="2048 performance benchmarks")
+    parser.add_argument("--only", choices=("engine", "gui"), help="run one group of benchmarks")
+    parser.add_argument("--grids", type=int, nargs="+", default=[4, 6, 8, 12, 16], help="grid sizes")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 2, 4], help="canvas scale factors")
+    parser.add_argument("--repeat", type=int, default=100, help="samples per benchmark")
+    parser.add_argument("--save", metavar="FILE", help="store the results as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with a stored baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.only in (None, "engine"):
+        import engine_bench
+        results.update(engine_bench.run(args.grids, args.repeat))
+    if args.only in (None, "gui"):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        # the game reads and writes its files in the working directory
+        scratch = tempfile.mkdtemp(prefix="2048-bench-")
+        for name in ("settings.ini", "buttons.css"):
+            shutil.copy(os.path.join(ROOT, name), scratch)
+        cwd = os.getcwd()
+        os.chdir(scratch)
+        try:
+            from PyQt5 import QtWidgets
+            app = QtWidgets.QApplication(sys.argv[:1])
+            import game
+            import gui_bench
+            results.update(gui_bench.run(game, args.grids, args.scales, args.repeat))
+            del app
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {"results": results}
+    if args.baseline:
+        with open(args.baseline) as source:
+            report["regressions"] = compare(results, json.load(source)["results"], args.tolerance)
+    if args.save:
+        with open(args.save, "w") as target:
+            json.dump({"results": results}, target, indent=1, sort_keys=True)
+    print(json.dumps(report, indent=1, sort_keys=True))
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,201 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Typed settings. 'settings.ini' is parsed and validated once into plain
+# attributes ('settings.grid', 'settings.colors["2"]', ...), the result is
+# kept in a marshal cache next to it and reused until the ini file changes.
+# Writing saves both, so the next start does not parse the ini again.
+
+
+# import standard
+import os
+import re
+import sys
+import zlib
+import marshal
+
+
+def _boolean(text):
+    states = {"1": True, "yes": True, "true": True, "on": True,
+              "0": False, "no": False, "false": False, "off": False}
+    return states[text.lower()]
+
+
+def _values(text):
+    return [int(value) for value in text.split()]
+
+
+def _format(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, list):
+        return " ".join(map(str, value))
+    return str(value)
+
+
+# attribute, section, option, parser, default, smallest allowed value
+SCHEMA = (
+    ("grid", "Game", "grid", int, 4, 4),
+    ("undo_limit", "Game", "undo.limit", int, 0, 0),
+    # game state of older versions, read when there is no autosave yet
+    ("highscore", "Game", "highscore", int, 0, 0),
+    ("save", "Game", "save", _values, [], None),
+    ("score", "Game", "score", int, 0, 0),
+    ("width", "Window", "width", int, 420, 1),
+    ("height", "Window", "height", int, 640, 1),
+    ("min_width", "Appearance", "min.width", int, 210, 1),
+    ("min_height", "Appearance", "min.height", int, 320, 1),
+    ("aspect_ratio", "Appearance", "aspect.ratio", float, 0.65625, 0.01),
+    ("time_animations", "Appearance", "time.animations", int, 150, 0),
+    ("journal_path", "Journal", "path", str, "game.journal", None),
+    ("journal_checkpoint", "Journal", "checkpoint", int, 256, 1),
+    ("journal_sync_moves", "Journal", "sync.moves", int, 32, 1),
+    ("journal_sync_interval", "Journal", "sync.interval", int, 1000, 1),
+    ("autosave_path", "Autosave", "path", str, "game.save", None),
+    ("autosave_interval", "Autosave", "interval", int, 2000, 0),
+    ("autosave_moves", "Autosave", "moves", int, 20, 1),
+    ("server_address", "Server", "address", str, "127.0.0.1:8048", None),
+    ("stats_path", "Stats", "path", str, "stats.db", None),
+    ("stats_batch", "Stats", "batch", int, 64, 1),
+    ("stats_interval", "Stats", "interval", int, 1000, 0),
+    ("ai_budget", "AI", "time.budget", int, 100, 1),
+    ("ai_cache_size", "AI", "cache.size", int, 200000, 0),
+    ("frame_stats", "Debug", "frame.stats", int, 0, 0),
+    ("overlay", "Debug", "overlay", _boolean, False, None),
+    ("overlay_window", "Debug", "overlay.window", int, 256, 1),
+    ("capture_moves", "Debug", "capture.moves", int, 100, 1),
+    ("capture_path", "Debug", "capture.path", str, "game.pstats", None),
+    ("startup_report", "Debug", "startup.report", _boolean, False, None),
+)
+
+COLORS = {"background": "faf8ef", "text.dark": "776e65", "text.light": "f9f6f2",
+          "grid": "bbada0", "cell": "cdc1b3",
+          "2": "eee4da", "4": "ede0c8", "8": "f2b179", "16": "f59563",
+          "32": "f67c5f", "64": "f65e3b", "128": "edcf72", "256": "edcc61",
+          "512": "edc850", "1024": "edc53f", "2048": "edc22e"}
+COLOR = re.compile(r"[0-9a-fA-F]{3}([0-9a-fA-F]{3}([0-9a-fA-F]{2})?)?$")
+
+LOCALE = {"title": "2048 Game on Python & PyQt", "subtitle": "2048", "score": "Score", "best": "Best",
+          "help": "Join the numbers and get to the 2048 tile!", "win": "CONGRATULATIONS!",
+          "lose": "GAME OVER!", "new": "Restart", "undo": "Undo", "hint": "Hint", "auto": "Auto",
+          "replay": "Replay", "profile": "Profile", "seed": "Seed",
+          "session": "Session", "stats": "Statistics"}
+
+# cached forms of another schema are ignored
+VERSION = zlib.crc32(repr([entry[:3] + entry[4:] for entry in SCHEMA]).encode())
+
+
+class Settings:
+
+    def __init__(self, path="settings.ini", cache_path="settings.cache"):
+        self.path = path                             # ini file, the source of truth
+        self.cache_path = cache_path                 # marshal form of the parsed ini
+        self.raw = {}                                # section -> option -> text, kept for saving
+        self.errors = []                             # validation messages
+        self.cached = False                          # values came from the cache
+        values = self.read_cache()
+        if values is None:
+            values = self.parse()
+            self.write_cache(values)
+        else:
+            self.cached = True
+        self.__dict__.update(values)
+        for error in self.errors:
+            sys.stderr.write("settings: %s\n" % error)
+
+    def stamp(self):
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return None
+        return [info.st_mtime_ns, info.st_size]
+
+    def read_cache(self):
+        try:
+            with open(self.cache_path, "rb") as source:
+                data = marshal.load(source)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != VERSION or data.get("stamp") != self.stamp():
+            return None
+        self.raw, self.errors = data["raw"], data["errors"]
+        return data["values"]
+
+    def write_cache(self, values):
+        data = {"version": VERSION, "stamp": self.stamp(), "raw": self.raw, "errors": self.errors, "values": values}
+        try:
+            with open(self.cache_path, "wb") as target:
+                marshal.dump(data, target)
+        except OSError as error:
+            sys.stderr.write("settings: %s\n" % error)
+
+    def parse(self):
+        import configparser
+        parser = configparser.ConfigParser(interpolation=None)
+        try:
+            parser.read(self.path)
+        except configparser.Error as error:
+            self.errors.append(str(error).replace("\n", " "))
+        self.raw = {section: dict(parser.items(section)) for section in parser.sections()}
+        values = {}
+        for attribute, section, option, convert, default, minimum in SCHEMA:
+            values[attribute] = default
+            text = self.raw.get(section, {}).get(option)
+            if text is None:
+                continue
+            try:
+                value = convert(text)
+            except (ValueError, KeyError):
+                self.errors.append("[%s] %s = %r is not valid, using %s" % (section, option, text, _format(default)))
+                continue
+            if minimum is not None and value < minimum:
+                self.errors.append("[%s] %s = %r is below %s, using %s" % (section, option, text, minimum,
+                                                                            _format(default)))
+                continue
+            values[attribute] = value
+        values["colors"] = dict(COLORS)
+        for option, text in self.raw.get("Appearance", {}).items():
+            if not option.startswith("color."):
+                continue
+            if COLOR.match(text):
+                values["colors"][option[len("color."):]] = text
+            else:
+                self.errors.append("[Appearance] %s = %r is not a color" % (option, text))
+        values["locale"] = dict(LOCALE)
+        values["locale"].update(self.raw.get("Locale", {}))
+        return values
+
+    def set(self, attribute, value):
+        # typed value now, its text for the next save
+        for name, section, option, convert, default, minimum in SCHEMA:
+            if name == attribute:
+                setattr(self, attribute, value)
+                self.raw.setdefault(section, {})[option] = _format(value)
+                return
+        raise AttributeError(attribute)
+
+    def values(self):
+        res = {entry[0]: getattr(self, entry[0]) for entry in SCHEMA}
+        res["colors"], res["locale"] = self.colors, self.locale
+        return res
+
+    def write(self):
+        # through a temporary file, a failed write leaves the old settings intact
+        import configparser
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.read_dict(self.raw)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as target:
+            parser.write(target)
+        os.replace(temporary, self.path)
+        self.write_cache(self.values())
@@ -0,0 +1,600 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Headless game rules. The board is a single packed integer holding the
+# log2 exponent of every cell (0 for an empty cell), row-major, cell (0, 0)
+# in the lowest bits. Cells are wide enough for the largest reachable
+# exponent (grid^2 + 1). Compact 4x4 rules, used by tables, search and
+# simulation, take 4 bits per cell instead: the board fits into 64 bits and
+# a row into a 16-bit table, but tiles stop merging at 32768.
+
+
+# import standard
+import random
+from collections import deque
+
+# move directions
+LEFT, RIGHT, UP, DOWN = 0, 1, 2, 3
+DIRECTIONS = (LEFT, RIGHT, UP, DOWN)
+
+# grids from this size on use the incremental engine
+LARGE_GRID = 16
+
+# most rows a lazy table keeps, every row of a 4x4 board with 4-bit cells
+TABLE_LIMIT = 1 << 16
+
+# legal direction sets by bit mask, bit 'direction' set for every legal one
+LEGAL = tuple(frozenset(direction for direction in DIRECTIONS if mask >> direction & 1) for mask in range(16))
+
+MASK64 = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15                          # splitmix64 stream increment
+
+
+def cell_bits(grid, compact=True):
+    if grid == 4 and compact:
+        return 4
+    return max(4, (grid * grid + 1).bit_length())
+
+
+def value_to_exponent(value):
+    return value.bit_length() - 1 if value else 0
+
+
+def exponent_to_value(exponent):
+    return 1 << exponent if exponent else 0
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(32)
+
+
+def _mix(value):
+    # splitmix64 finalizer
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+class GameRandom:
+
+    # Counter-based generator: the n-th draw of a game is a hash of its seed
+    # and n, so (seed, draws) is the whole state. A saved game continues the
+    # same stream and games never share generator state.
+
+    __slots__ = ("seed", "draws", "base")
+
+    def __init__(self, seed=None, draws=0):
+        self.seed = new_seed() if seed is None else seed
+        self.draws = draws                           # values drawn so far
+        self.base = _mix(self.seed & MASK64)         # stream origin
+
+    def next(self):
+        self.draws += 1
+        return _mix((self.base + self.draws * GOLDEN) & MASK64)
+
+    def randrange(self, stop):
+        # multiply-shift into [0, stop), the bias is below stop / 2^64
+        return (self.next() * stop) >> 64
+
+    def choice(self, sequence):
+        return sequence[self.randrange(len(sequence))]
+
+
+class LazyTable(dict):
+    # row -> value computed on first access. Rows wider than 16 bits take
+    # far more values than fit in memory, so a full table is moved aside
+    # and starts over; rows still in use are taken back from the old one
+
+    def __init__(self, rules):
+        super(LazyTable, self).__init__()
+        self.rules = rules
+        self.old = {}                                # rows of the previous generation
+
+    def __missing__(self, row):
+        res = self.old.get(row)
+        if res is None:
+            res = self.compute(row)
+        if len(self) >= TABLE_LIMIT:
+            self.old = dict(self)
+            self.clear()
+        self[row] = res
+        return res
+
+    def compute(self, row):
+        raise NotImplementedError
+
+
+class _RowTable(LazyTable):
+    # row -> (moved row, score)
+
+    def __init__(self, rules, reverse):
+        super(_RowTable, self).__init__(rules)
+        self.reverse = reverse
+
+    def compute(self, row):
+        rules = self.rules
+        cells = rules.unpack_row(row)
+        if self.reverse:
+            cells.reverse()
+        cells, score = rules.slide_left(cells)
+        if self.reverse:
+            cells.reverse()
+        return rules.pack_row(cells), score
+
+
+class _SpreadTable(LazyTable):
+    # row -> the same cells laid out down column 0 of a board
+
+    def compute(self, row):
+        rules = self.rules
+        res = 0
+        for index, exponent in enumerate(rules.unpack_row(row)):
+            res |= exponent << (index * rules.row_bits)
+        return res
+
+
+class _StateTable(LazyTable):
+    # row -> bit 0: slides left, bit 1: slides right, bit 2: holds a 2048 tile
+
+    def compute(self, row):
+        rules = self.rules
+        return ((rules.left[row][0] != row) | (rules.right[row][0] != row) << 1 |
+                (11 in rules.unpack_row(row)) << 2)
+
+
+class Rules:
+
+    _cache = {}
+
+    def __init__(self, grid, compact=True):
+        self.grid = grid                             # grid resolution
+        self.bits = cell_bits(grid, compact)         # bits per cell
+        self.limit = (1 << self.bits) - 1            # highest storable exponent
+        self.cell_mask = self.limit
+        self.row_bits = self.bits * grid             # bits per row
+        self.row_mask = (1 << self.row_bits) - 1
+        self.size = grid * grid                      # cells count
+        self.ones = sum(1 << (index * self.bits) for index in range(self.size))  # lowest bit of every cell
+        self.left = _RowTable(self, False)
+        self.right = _RowTable(self, True)
+        self.spread = _SpreadTable(self)
+        self.states = _StateTable(self)
+
+    @classmethod
+    def for_grid(cls, grid, compact=True):
+        key = grid, cell_bits(grid, compact)
+        if key not in cls._cache:
+            cls._cache[key] = cls(grid, compact)
+        return cls._cache[key]
+
+    def precompute(self):
+        # fill the row tables up front when they are small enough (4x4 only)
+        if self.row_bits > 16:
+            return False
+        for row in range(1 << self.row_bits):
+            self.left[row]
+            self.right[row]
+            self.spread[row]
+            self.states[row]
+        return True
+
+    # packing
+
+    def unpack_row(self, row):
+        bits, mask = self.bits, self.cell_mask
+        return [(row >> (index * bits)) & mask for index in range(self.grid)]
+
+    def pack_row(self, cells):
+        res = 0
+        for index, exponent in enumerate(cells):
+            res |= exponent << (index * self.bits)
+        return res
+
+    def unpack(self, board):
+        bits, mask = self.bits, self.cell_mask
+        return [(board >> (index * bits)) & mask for index in range(self.size)]
+
+    def pack(self, exponents):
+        res = 0
+        for index, exponent in enumerate(exponents):
+            if exponent > self.limit:
+                raise ValueError("exponent %d does not fit %d-bit cells" % (exponent, self.bits))
+            res |= exponent << (index * self.bits)
+        return res
+
+    def from_values(self, values):
+        return self.pack([value_to_exponent(value) for value in values])
+
+    def to_values(self, board):
+        return [exponent_to_value(exponent) for exponent in self.unpack(board)]
+
+    def get(self, board, index):
+        return (board >> (index * self.bits)) & self.cell_mask
+
+    def put(self, board, index, exponent):
+        shift = index * self.bits
+        return (board & ~(self.cell_mask << shift)) | (exponent << shift)
+
+    # moves
+
+    def slide_left(self, cells):
+        # slide one line towards index 0, every tile merges at most once
+        res, score, merged = [], 0, False
+        for exponent in cells:
+            if not exponent:
+                continue
+            if res and not merged and res[-1] == exponent and exponent < self.limit:
+                res[-1] += 1
+                score += 1 << res[-1]
+                merged = True
+            else:
+                res.append(exponent)
+                merged = False
+        return res + [0] * (len(cells) - len(res)), score
+
+    def trace(self, cells):
+        # destination index of every tile of a line slid towards index 0
+        res, last, pos, merged = [], 0, -1, False
+        for exponent in cells:
+            if not exponent:
+                res.append(None)
+            elif pos >= 0 and not merged and last == exponent and exponent < self.limit:
+                res.append(pos)
+                merged = True
+            else:
+                pos += 1
+                res.append(pos)
+                last, merged = exponent, False
+        return res
+
+    def transpose(self, board):
+        res, row_bits, row_mask, spread = 0, self.row_bits, self.row_mask, self.spread
+        for row in range(self.grid):
+            res |= spread[(board >> (row * row_bits)) & row_mask] << (row * self.bits)
+        return res
+
+    def _move_rows(self, board, table):
+        res, score, row_bits, row_mask = 0, 0, self.row_bits, self.row_mask
+        for row in range(self.grid):
+            shift = row * row_bits
+            moved, gained = table[(board >> shift) & row_mask]
+            res |= moved << shift
+            score += gained
+        return res, score
+
+    def move(self, board, direction):
+        if direction == LEFT:
+            return self._move_rows(board, self.left)
+        if direction == RIGHT:
+            return self._move_rows(board, self.right)
+        res, score = self._move_rows(self.transpose(board), self.left if direction == UP else self.right)
+        return self.transpose(res), score
+
+    # state queries
+
+    def empty_cells(self, board):
+        bits, mask = self.bits, self.cell_mask
+        return [index for index in range(self.size) if not (board >> (index * bits)) & mask]
+
+    def free_mask(self, board):
+        # the lowest bit of every empty cell
+        occupied = board
+        for shift in range(1, self.bits):
+            occupied |= board >> shift
+        return ~occupied & self.ones
+
+    def max_exponent(self, board):
+        return max(self.unpack(board))
+
+    def contains(self, board, exponent):
+        return exponent in self.unpack(board)
+
+    def check(self, board):
+        # (legal directions, 2048 on the board) in one pass over rows and columns
+        states, row_bits, row_mask = self.states, self.row_bits, self.row_mask
+        transposed = self.transpose(board)
+        rows = columns = 0
+        for row in range(self.grid):
+            shift = row * row_bits
+            rows |= states[(board >> shift) & row_mask]
+            columns |= states[(transposed >> shift) & row_mask]
+        return LEGAL[(rows & 3) | (columns & 3) << 2], bool(rows & 4)
+
+    def legal(self, board):
+        return self.check(board)[0]
+
+    def can_move(self, board):
+        return bool(self.free_mask(board)) or bool(self.legal(board))
+
+    def spawn(self, board, rng=random):
+        # same rule as the GUI always had: ~10% of new tiles are 4. The cell is
+        # the n-th set bit of the free mask, no list of empty cells is built
+        free = self.free_mask(board)
+        for _ in range(rng.randrange(bin(free).count("1"))):
+            free &= free - 1
+        index = ((free & -free).bit_length() - 1) // self.bits
+        exponent = 2 if rng.randrange(99) > 89 else 1
+        return self.put(board, index, exponent), index, exponent
+
+
+class Engine:
+
+    def __init__(self, grid=4, rng=None, compact=True):
+        self.rules = Rules.for_grid(grid, compact)   # shared lookup tables
+        self.rng = rng or GameRandom()               # spawn randomness
+        self.board = 0                               # packed exponents
+        self.score = 0                               # collected score
+        self.moves = 0                               # applied moves counter
+        self.changed = None                          # lines changed by the last move, None for all
+
+    @property
+    def grid(self):
+        return self.rules.grid
+
+    def reset(self, values=None, score=0):
+        self.load(self.rules.from_values(values) if values else 0)
+        self.score = score
+        self.moves = 0
+
+    def reseed(self, seed=None, draws=0):
+        # a fresh stream for a new game, or the saved position of an old one
+        self.rng = GameRandom(seed, draws)
+
+    def load(self, board):
+        self.board = board
+
+    def get(self, index):
+        return self.rules.get(self.board, index)
+
+    def values(self):
+        return self.rules.to_values(self.board)
+
+    def empty_cells(self):
+        return self.rules.empty_cells(self.board)
+
+    def move(self, direction):
+        board, score = self.rules.move(self.board, direction)
+        if board == self.board:
+            return None
+        self.board = board
+        self.score += score
+        self.moves += 1
+        return score
+
+    def spawn(self):
+        self.board, index, exponent = self.rules.spawn(self.board, self.rng)
+        return index, exponent
+
+    def check(self):
+        return self.rules.check(self.board)
+
+    def legal(self):
+        return self.check()[0]
+
+    def max_exponent(self):
+        return self.rules.max_exponent(self.board)
+
+
+class LargeEngine(Engine):
+
+    # Big grids keep the exponents in a bytearray next to the packed board
+    # and update everything per changed cell: the packed board, the empty
+    # cells of every row, tile counts for the max tile and the number of
+    # equal neighbours in every row and column. Spawns take the n-th empty
+    # cell in index order like Rules.spawn, so a (seed, draws) pair spawns
+    # the same cells whatever order the board was built in. Game over is
+    # then 'no empty cell and no equal neighbours', and a move skips every
+    # line that is already packed and has no equal neighbours.
+
+    def __init__(self, grid=16, rng=None):
+        super(LargeEngine, self).__init__(grid, rng)
+        size = self.rules.size
+        self.cells = bytearray(size)                 # exponents, row-major
+        self.free = size                             # empty cells count
+        self.row_free = [grid] * grid                # empty cells of every row
+        self.counts = [0] * (self.rules.limit + 1)   # tiles count by exponent
+        self.top = 0                                 # highest exponent on the board
+        self.row_pairs = [0] * grid                  # equal neighbours inside every row
+        self.column_pairs = [0] * grid               # equal neighbours inside every column
+        self.pairs = 0                               # equal neighbours on the whole board
+        self.indices = self.build_indices()          # cells of every line for every direction
+
+    def build_indices(self):
+        grid = self.grid
+        rows = [list(range(row * grid, (row + 1) * grid)) for row in range(grid)]
+        columns = [list(range(column, grid * grid, grid)) for column in range(grid)]
+        return {LEFT: rows,
+                RIGHT: [row[::-1] for row in rows],
+                UP: columns,
+                DOWN: [column[::-1] for column in columns]}
+
+    def line(self, direction, number):
+        grid = self.grid
+        if direction == LEFT:
+            return self.cells[number * grid:(number + 1) * grid]
+        if direction == RIGHT:
+            return self.cells[number * grid:(number + 1) * grid][::-1]
+        if direction == UP:
+            return self.cells[number::grid]
+        return self.cells[number::grid][::-1]
+
+    def neighbours(self, index, exponent, sign):
+        # add or remove the equal-neighbour pairs 'index' makes with 'exponent'
+        if not exponent:
+            return
+        grid, cells = self.grid, self.cells
+        row, column = divmod(index, grid)
+        horizontal = (column > 0 and cells[index - 1] == exponent) + \
+                     (column < grid - 1 and cells[index + 1] == exponent)
+        vertical = (row > 0 and cells[index - grid] == exponent) + \
+                   (row < grid - 1 and cells[index + grid] == exponent)
+        self.row_pairs[row] += sign * horizontal
+        self.column_pairs[column] += sign * vertical
+        self.pairs += sign * (horizontal + vertical)
+
+    def put(self, index, exponent):
+        old = self.cells[index]
+        if old == exponent:
+            return
+        self.neighbours(index, old, -1)
+        self.cells[index] = exponent
+        self.neighbours(index, exponent, 1)
+        self.board ^= (old ^ exponent) << (index * self.rules.bits)
+        if old:
+            self.counts[old] -= 1
+            while self.top and not self.counts[self.top]:
+                self.top -= 1
+        else:
+            self.free -= 1
+            self.row_free[index // self.grid] -= 1
+        if exponent:
+            self.counts[exponent] += 1
+            self.top = max(self.top, exponent)
+        else:
+            self.free += 1
+            self.row_free[index // self.grid] += 1
+
+    def load(self, board):
+        for index, exponent in enumerate(self.rules.unpack(board)):
+            self.put(index, exponent)
+
+    def get(self, index):
+        return self.cells[index]
+
+    def values(self):
+        return [exponent_to_value(exponent) for exponent in self.cells]
+
+    def empty_cells(self):
+        return [index for index, exponent in enumerate(self.cells) if not exponent]
+
+    def move(self, direction):
+        rules, changed, score = self.rules, [], 0
+        pairs = self.row_pairs if direction in (LEFT, RIGHT) else self.column_pairs
+        for number, indices in enumerate(self.indices[direction]):
+            line = self.line(direction, number)
+            if not pairs[number] and 0 not in line.rstrip(b"\0"):
+                continue
+            cells, gained = rules.slide_left(list(line))
+            for position, exponent in enumerate(cells):
+                if exponent != line[position]:
+                    self.put(indices[position], exponent)
+            changed.append(number)
+            score += gained
+        self.changed = changed
+        if not changed:
+            return None
+        self.score += score
+        self.moves += 1
+        return score
+
+    def spawn(self):
+        # the n-th empty cell in index order: skip whole rows, then scan one
+        rest, grid, row = self.rng.randrange(self.free), self.grid, 0
+        while rest >= self.row_free[row]:
+            rest -= self.row_free[row]
+            row += 1
+        index = row * grid
+        while True:
+            if not self.cells[index]:
+                if not rest:
+                    break
+                rest -= 1
+            index += 1
+        exponent = 2 if self.rng.randrange(99) > 89 else 1
+        self.put(index, exponent)
+        return index, exponent
+
+    def check(self):
+        # legal directions from the pair counts and the gaps of every line;
+        # a full board has no gaps, the counters alone answer for it
+        won = self.counts[11] > 0
+        if not self.free:
+            if not self.pairs:
+                return LEGAL[0], won
+            return LEGAL[(3 if any(self.row_pairs) else 0) | (12 if any(self.column_pairs) else 0)], won
+        mask = 0
+        for first, second, pairs in ((LEFT, RIGHT, self.row_pairs), (UP, DOWN, self.column_pairs)):
+            both = 1 << first | 1 << second
+            for number in range(self.grid):
+                if pairs[number]:
+                    mask |= both
+                if mask & both == both:
+                    break
+                line = self.line(first, number)
+                if 0 in line.rstrip(b"\0"):
+                    mask |= 1 << first
+                if 0 in line.lstrip(b"\0"):
+                    mask |= 1 << second
+        return LEGAL[mask], won
+
+    def max_exponent(self):
+        return self.top
+
+
+def create(grid, rng=None, compact=True):
+    # incremental engine for big grids, lookup tables for small ones
+    return LargeEngine(grid, rng) if grid >= LARGE_GRID else Engine(grid, rng, compact)
+
+
+class History:
+
+    def __init__(self, rules, limit=0, widths=(32,)):
+        # every snapshot is one integer: the packed board, the caller's game
+        # fields above it, each in its bit width from 'widths', and the score
+        # on top
+        shift = rules.bits * rules.size
+        self.mask = (1 << shift) - 1
+        self.fields = []                              # (offset, mask) of every game field
+        for width in widths:
+            self.fields.append((shift, (1 << width) - 1))
+            shift += width
+        self.score_shift = shift
+        self.done = deque(maxlen=limit or None)       # snapshots to undo to
+        self.undone = []                              # snapshots to redo to
+
+    def pack(self, board, score, fields):
+        snapshot = board | score << self.score_shift
+        for (shift, mask), value in zip(self.fields, fields):
+            snapshot |= (value & mask) << shift
+        return snapshot
+
+    def unpack(self, snapshot):
+        return (snapshot & self.mask, snapshot >> self.score_shift,
+                tuple(snapshot >> shift & mask for shift, mask in self.fields))
+
+    def push(self, board, score, fields):
+        self.done.append(self.pack(board, score, fields))
+        self.undone.clear()
+
+    def undo(self, board, score, fields):
+        # (board, score, fields) to go back to, None when there is none
+        if not self.done:
+            return None
+        self.undone.append(self.pack(board, score, fields))
+        return self.unpack(self.done.pop())
+
+    def redo(self, board, score, fields):
+        if not self.undone:
+            return None
+        self.done.append(self.pack(board, score, fields))
+        return self.unpack(self.undone.pop())
+
+    def can_undo(self):
+        return bool(self.done)
+
+    def can_redo(self):
+        return bool(self.undone)
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
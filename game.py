@@ -15,17 +15,110 @@
 
 
 # import standard
-import sys
 import time
-import random
-import configparser
+startup_time = time.perf_counter()                   # start of the startup timing report
+import os
+import sys
+import json
+import cProfile
+import argparse
+import multiprocessing
+from collections import deque, OrderedDict
 
 # import third-party
 from PyQt5 import QtWidgets, QtGui, QtCore
 
+# import local
+import ai
+import autosave
+import config
+import engine
+import journal
+import simulation
+import stats
+
+import_time = time.perf_counter()
+
 # read configuration
-cfg = configparser.ConfigParser()
-cfg.read('settings.ini')
+settings = config.Settings('settings.ini')
+config_time = time.perf_counter()
+
+
+class Theme:
+
+    def __init__(self):
+        # colors, strings and timings are parsed once at startup
+        self.duration = settings.time_animations
+        self.background = self.color("background")
+        self.grid = self.color("grid")
+        self.cell = self.color("cell")
+        self.text_dark = self.color("text.dark")
+        self.text_light = self.color("text.light")
+        self.shadow = QtGui.QColor(187, 173, 160, 100)
+        self.tiles = {}
+        value = 2
+        while str(value) in settings.colors:
+            self.tiles[value] = self.color(value)
+            value *= 2
+        self.locale = settings.locale
+        self.sprites = {}                            # value -> sprite, values up to 2048 stay
+        self.rare = OrderedDict()                    # sprites of bigger values, least recent first
+        self.rare_limit = 8                          # bigger values kept at once
+        self.sf = 1                                  # scale factor of the sprites
+        self.tl = 37.5                               # tile length of the sprites
+        self.ratio = 1.0                             # device pixel ratio of the sprites
+
+    @staticmethod
+    def color(key):
+        return QtGui.QColor("#" + settings.colors[str(key)])
+
+    def tile_color(self, value):
+        return self.tiles.get(value, self.tiles[2048])
+
+    def text_color(self, value):
+        return self.text_light if value > 4 else self.text_dark
+
+    def scale(self, sf, tl, ratio):
+        # sprites are drawn again on first use at the new size
+        if (sf, tl, ratio) != (self.sf, self.tl, self.ratio):
+            self.sf, self.tl, self.ratio = sf, tl, ratio
+            self.sprites.clear()
+            self.rare.clear()
+
+    def sprite(self, value):
+        # full size tile at the device resolution, smaller and bigger frames scale it
+        sprite = self.sprites.get(value)
+        if sprite is not None:
+            return sprite
+        if value <= 2048:
+            sprite = self.sprites[value] = self.draw_sprite(value)
+            return sprite
+        if value in self.rare:
+            self.rare.move_to_end(value)
+            return self.rare[value]
+        sprite = self.rare[value] = self.draw_sprite(value)
+        if len(self.rare) > self.rare_limit:
+            self.rare.popitem(last=False)
+        return sprite
+
+    def draw_sprite(self, value):
+        size = max(1, int(self.tl))
+        pixmap = QtGui.QPixmap(int(size * self.ratio), int(size * self.ratio))
+        pixmap.setDevicePixelRatio(self.ratio)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHints(QtGui.QPainter.Antialiasing | QtGui.QPainter.TextAntialiasing)
+        painter.setPen(self.tile_color(value))
+        painter.setBrush(self.tile_color(value))
+        rect = QtCore.QRect(0, 0, size, size)
+        painter.drawRoundedRect(rect, self.sf * 3, self.sf * 3, QtCore.Qt.AbsoluteSize)
+        painter.setPen(self.text_color(value))
+        font = QtGui.QFont()
+        font.setPixelSize(max(1, int((16 if value < 1024 else 15) * self.sf)))
+        painter.setFont(font)
+        painter.drawText(rect, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignVCenter, str(value))
+        painter.end()
+        return pixmap
 
 
 class Tile(QtCore.QObject):
@@ -38,24 +131,52 @@ class Tile(QtCore.QObject):
         self._y = 0
         self._width = 0
         self._height = 0
-        self.move_animation = QtCore.QPropertyAnimation(self, b'geometry')
-        self.move_animation.setDuration(int(cfg.get("Appearance", "time.animations")))
-        self.spawn_animation = QtCore.QPropertyAnimation(self, b'geometry')
-        self.spawn_animation.setDuration(int(cfg.get("Appearance", "time.animations")))
-        self.splash_animation = QtCore.QPropertyAnimation(self, b'geometry')
-        self.splash_animation.setDuration(int(cfg.get("Appearance", "time.animations")))
-        self.cell_color = QtGui.QColor("#" + cfg.get("Appearance", "color.%s" % value if value <= 2048 else 2048))
-        self.text_color = QtGui.QColor("#" + cfg.get("Appearance", "color.text.dark"))
-        if value > 4:
-            self.text_color = QtGui.QColor("#" + cfg.get("Appearance", "color.text.light"))
-        self.font = QtGui.QFont()
+        self._move_animation = None                  # animations are built on first use
+        self._spawn_animation = None
+        self._splash_animation = None
+
+    def reset(self, value):
+        # prepare a pooled tile for reuse
+        for animation in (self._move_animation, self._spawn_animation, self._splash_animation):
+            if animation is not None:
+                animation.stop()
+        self.value = value
+        self._x = 0
+        self._y = 0
+        self._width = 0
+        self._height = 0
+
+    def build_animation(self):
+        animation = QtCore.QPropertyAnimation(self, b'geometry')
+        animation.setDuration(self.matrix.parent.theme.duration)
+        return animation
+
+    @property
+    def move_animation(self):
+        if self._move_animation is None:
+            self._move_animation = self.build_animation()
+        return self._move_animation
+
+    @property
+    def spawn_animation(self):
+        if self._spawn_animation is None:
+            self._spawn_animation = self.build_animation()
+        return self._spawn_animation
+
+    @property
+    def splash_animation(self):
+        if self._splash_animation is None:
+            self._splash_animation = self.build_animation()
+        return self._splash_animation
 
     def setGeometry(self, rect: QtCore.QRect):
+        dirty = self.getGeometry()
         self._x = rect.x()
         self._y = rect.y()
         self._width = rect.width()
         self._height = rect.height()
-        self.matrix.parent.update()
+        # repaint only the area the tile left and the area it covers now
+        self.matrix.invalidate(dirty.united(self.getGeometry()).adjusted(-1, -1, 1, 1))
 
     def getGeometry(self):
         if int(self.matrix.tl) == int(self._width):
@@ -67,25 +188,14 @@ class Tile(QtCore.QObject):
                                 self._height)
 
     def render(self, painter):
-        painter.setPen(self.cell_color)
-        painter.setBrush(self.cell_color)
-        painter.drawRoundedRect(self.getGeometry(),
-                                self.matrix.sf * 3,
-                                self.matrix.sf * 3,
-                                QtCore.Qt.AbsoluteSize)
-        painter.setPen(self.text_color)
-        pixel_size = int(16 * self.matrix.sf * (self._width/self.matrix.tl)) if self.value < 1024 else \
-            int(15 * self.matrix.sf * (self._width / self.matrix.tl))
-        self.font.setPixelSize(pixel_size if pixel_size else 1)
-        painter.setFont(self.font)
-        painter.drawText(self.getGeometry(),
-                         QtCore.Qt.AlignHCenter | QtCore.Qt.AlignVCenter,
-                         str(self.value))
+        rect = self.getGeometry()
+        if rect.width() > 0:
+            painter.drawPixmap(rect, self.matrix.parent.theme.sprite(self.value))
 
     def spawn(self):
         self.spawn_animation.setStartValue(QtCore.QRect(self._x, self._y, int(self.matrix.tl/2), int(self.matrix.tl/2)))
         self.spawn_animation.setEndValue(QtCore.QRect(self._x, self._y, self._width, self._height))
-        self.spawn_animation.start()
+        return self.spawn_animation
 
     def splash(self):
         self.splash_animation.setStartValue(self.getGeometry())
@@ -94,30 +204,73 @@ class Tile(QtCore.QObject):
                                                               int(self._width + 7 * self.matrix.sf),
                                                               int(self._height + 7 * self.matrix.sf)))
         self.splash_animation.setEndValue(self.getGeometry())
-        self.splash_animation.start()
+        return self.splash_animation
 
     def move(self, target: QtCore.QPoint):
         self.move_animation.setStartValue(self.getGeometry())
         self.move_animation.setEndValue(QtCore.QRect(target.x(), target.y(), self._width, self._height))
-        self.move_animation.start()
+        return self.move_animation
 
     # noinspection PyUnresolvedReferences
     geometry = QtCore.pyqtProperty(QtCore.QRect, fset=setGeometry)
 
 
+class TilePool:
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.free = []                               # released tiles ready for reuse
+        self.limit = 2 * matrix.grid ** 2            # most tiles a board can show at once
+        self.created = 0                             # Tile objects ever built
+        self.reused = 0                              # acquisitions served from the pool
+
+    def acquire(self, value):
+        if self.free:
+            tile = self.free.pop()
+            tile.reset(value)
+            self.reused += 1
+            return tile
+        self.created += 1
+        return Tile(self.matrix, value)
+
+    def release(self, tile):
+        if tile and len(self.free) < self.limit:
+            self.free.append(tile)
+
+    def live(self):
+        return self.created - len(self.free)
+
+
 class Matrix:
 
     def __init__(self, parent):
         self.parent = parent                         # parent link for tiles updating
+        self.canvas = None                           # widget to repaint, set by Canvas
         self.data = []                               # tiles and coords massive
-        self.grid = int(cfg.get("Game", "grid"))     # grid resolution
+        self.grid = settings.grid                    # grid resolution
+        self.engine = engine.create(self.grid, compact=False)  # headless game state, tiles merge past 32768
+        self.lines = self.build_lines()              # cells order for every direction
+        self.pool = TilePool(self)                   # recycled Tile objects
         self.sf = 1                                  # current scale factor
         self.tl = 37.5                               # target tile length
         self.sp = 4                                  # space beetwen tiles
+        self.gained = 0                              # score of the last move
+        self.direction = None                        # direction of the last move
+        self.moving = []                             # tiles in the running move animation
+        self.merged = []                             # cells holding two tiles until collect
+        self.animation = QtCore.QParallelAnimationGroup()  # tiles movement of the current move
+        self.effects = QtCore.QParallelAnimationGroup()    # spawn and splash of new tiles
+        self.effects.finished.connect(lambda: self.release(self.effects))
         self.modified = False                        # modified anchor
-        self.save_loaded = False                     # loading progress anchor
-        save = cfg.get("Game", "save")
-        self.fill(list(map(int, save.split(" "))) if save else None)
+        self.fill()
+
+    def build_lines(self):
+        rows = [[(r, c) for c in range(self.grid)] for r in range(self.grid)]
+        columns = [[(r, c) for r in range(self.grid)] for c in range(self.grid)]
+        return {engine.LEFT: rows,
+                engine.RIGHT: [row[::-1] for row in rows],
+                engine.UP: columns,
+                engine.DOWN: [column[::-1] for column in columns]}
 
     def update(self):
         self.tl = (150.0 / self.grid) * self.sf       # length of tile side
@@ -134,6 +287,10 @@ class Matrix:
 
     def fill(self, defaults=None):
         # create empty
+        for row in self.data:
+            for cell in row:
+                for tile in cell['data']:
+                    self.pool.release(tile)
         self.data = []
         for row in range(self.grid):
             self.data.append([])
@@ -141,145 +298,314 @@ class Matrix:
                 self.data[row].append({'position': None, 'data': []})
         # create source
         if defaults and len(defaults) == self.grid ** 2:
-            src = defaults
-            self.save_loaded = True
+            self.engine.reset(defaults)
         else:
-            src = [0 for x in range(self.grid ** 2)]
+            self.engine.reset()
         # fill
+        self.sync()
+
+    def sync(self):
+        # rebuild tiles from the engine board
+        src = self.engine.values()
         counter = 0
         for row in self.data:
             for cell in row:
-                cell['data'].append(Tile(self, src[counter]) if src[counter] else 0)
+                cell['data'] = [self.pool.acquire(src[counter]) if src[counter] else 0]
                 counter += 1
+        self.invalidate()
 
-    def to_render(self):
-        res = []
-        for row in self.data:
-            for cell in row:
-                if cell['data'][0]:
-                    res.append(cell['data'][0])
-                    if len(cell['data']) > 1:
-                        res.append(cell['data'][1])
-        return res
+    def invalidate(self, rect=None):
+        # Qt merges all requests made before the next frame into one repaint
+        if self.canvas is None:
+            return
+        if rect is None:
+            self.canvas.update()
+        else:
+            self.canvas.update(rect)
 
-    def find_empty_cells(self):
+    def cells_range(self, start, end, offset):
+        # cells overlapping [start, end] along one axis, one extra on both sides for splashes
+        pitch = self.tl + self.sp
+        first = int((start - offset * self.sf - self.sp) // pitch) - 1
+        last = int((end - offset * self.sf - self.sp) // pitch) + 1
+        return range(max(first, 0), min(last, self.grid - 1) + 1)
+
+    def to_render(self, rect=None):
+        if rect is None:
+            rows = columns = range(self.grid)
+        else:
+            rows = self.cells_range(rect.top(), rect.bottom(), 130)
+            columns = self.cells_range(rect.left(), rect.right(), 20)
+        moving = set(self.moving)
         res = []
-        for row in range(self.grid):
-            for cell in range(self.grid):
-                if self.data[row][cell]['data'][0] == 0:
-                    res.append((row, cell))
-        return res
+        for row in rows:
+            for column in columns:
+                for tile in self.data[row][column]['data']:
+                    if tile and tile not in moving:
+                        res.append(tile)
+        # sliding tiles can be anywhere between two cells, draw them on top
+        return res + self.moving
 
     def spawn(self):
-        row, cell = random.choice(self.find_empty_cells())
-        tile = Tile(self, 4 if random.randrange(99) > 89 else 2)
+        index, exponent = self.engine.spawn()
+        row, cell = divmod(index, self.grid)
+        tile = self.pool.acquire(engine.exponent_to_value(exponent))
         tile.setGeometry(QtCore.QRect(self.data[row][cell]['position'].x(),
                                       self.data[row][cell]['position'].y(),
                                       int(self.tl), int(self.tl)))
         self.data[row][cell]['data'] = [tile]
-        tile.spawn()
+        self.effects.addAnimation(tile.spawn())
+        self.effects.start()
+        return index, exponent
 
     def collect(self):
-        for row in self.data:
-            for cell in row:
-                if len(cell['data']) > 1:
-                    score = cell['data'][0].value + cell['data'][1].value
-                    self.parent.score += score
-                    if self.parent.score > self.parent.highscore:
-                        self.parent.highscore = self.parent.score
-                    new_tile = Tile(self, score)
-                    new_tile.setGeometry(QtCore.QRect(cell['position'].x(),
-                                                      cell['position'].y(),
-                                                      int(self.tl), int(self.tl)))
-                    cell['data'] = [new_tile]
-                    new_tile.splash()
-
-    def shift_tile_left(self, r, c):
-        if c == 0 or len(self.data[r][c - 1]['data']) > 1:
-            return r, c
-        if self.data[r][c - 1]['data'][0] == 0:
-            self.data[r][c - 1]['data'] = self.data[r][c]['data']
-            self.data[r][c]['data'] = [0]
-            return self.shift_tile_left(r, c - 1)
-        if self.data[r][c - 1]['data'][0].value == self.data[r][c]['data'][0].value:
-            self.data[r][c - 1]['data'].append(self.data[r][c]['data'][0])
-            self.data[r][c]['data'] = [0]
-            return r, c - 1
-        return r, c
-
-    def merge(self):
-        start_anim_time = None
-        for r in range(self.grid):
-            for c in range(self.grid):
-                if self.data[r][c]['data'][0] != 0:
-                    tile = self.data[r][c]['data'][0]
-                    nr, nc = self.shift_tile_left(r, c)
-                    if nc != c:
-                        tile.move(self.data[nr][nc]['position'])
-                        self.modified = True
-                        start_anim_time = time.time()
-        if start_anim_time:
-            while time.time() - start_anim_time < int(cfg.get("Appearance", "time.animations")) / 1000:
-                self.parent.update()
-
-    def reverse(self):
-        data = []
-        for row in self.data:
-            new_row = []
-            for cell in row:
-                new_row.insert(0, cell)
-            data.append(new_row)
-        self.data = data
+        self.parent.score += self.gained
+        if self.parent.score > self.parent.highscore:
+            self.parent.highscore = self.parent.score
+        self.gained = 0
+        for r, c in self.merged:
+            cell = self.data[r][c]
+            value = engine.exponent_to_value(self.engine.get(r * self.grid + c))
+            for tile in cell['data']:
+                self.pool.release(tile)
+            new_tile = self.pool.acquire(value)
+            new_tile.setGeometry(QtCore.QRect(cell['position'].x(),
+                                              cell['position'].y(),
+                                              int(self.tl), int(self.tl)))
+            cell['data'] = [new_tile]
+            self.effects.addAnimation(new_tile.splash())
+        self.merged = []
 
-    def rotateLeft(self):
-        data = [[] for x in range(self.grid)]
-        for row in range(self.grid):
-            for cell in range(self.grid):
-                data[- 1 - cell].append(self.data[row][cell])
-        self.data = data
+    def animating(self):
+        return self.animation.state() == QtCore.QAbstractAnimation.Running
 
-    def rotateRight(self):
-        data = [[] for x in range(self.grid)]
-        for row in range(self.grid):
-            for cell in range(self.grid):
-                data[cell].insert(0, self.data[row][cell])
-        self.data = data
+    def release(self, group):
+        # give animations back to their tiles so they can be reused
+        while group.animationCount():
+            group.takeAnimation(0)
+        if group is self.animation:
+            self.moving = []
 
-    def backup(self):
-        res = []
-        for row in range(self.grid):
-            res.append([])
-            for cell in range(self.grid):
-                res[row].append({})
-                res[row][cell]['data'] = self.data[row][cell]['data'].copy()
-        return res
+    def snap(self, group):
+        # jump to the last frame, 'finished' handlers run right away
+        if group.state() == QtCore.QAbstractAnimation.Running:
+            group.setCurrentTime(group.totalDuration())
+
+    def finish(self):
+        self.snap(self.animation)
+        self.snap(self.effects)
+
+    def merge(self, direction):
+        self.snap(self.effects)
+        rules = self.engine.rules
+        gained = self.engine.move(direction)
+        if gained is None:
+            return
+        self.gained = gained
+        self.direction = direction
+        self.modified = True
+        changed = range(self.grid) if self.engine.changed is None else self.engine.changed
+        for number in changed:
+            line = self.lines[direction][number]
+            tiles = [self.data[r][c]['data'] for r, c in line]
+            targets = rules.trace([engine.value_to_exponent(cell[0].value) if cell[0] else 0 for cell in tiles])
+            moved = [[] for _ in line]
+            for index, target in enumerate(targets):
+                if target is not None:
+                    moved[target].append(tiles[index][0])
+                    if target != index:
+                        r, c = line[target]
+                        self.animation.addAnimation(tiles[index][0].move(self.data[r][c]['position']))
+                        self.moving.append(tiles[index][0])
+            for (r, c), cell in zip(line, moved):
+                self.data[r][c]['data'] = cell or [0]
+                if len(cell) > 1:
+                    self.merged.append((r, c))
+        self.animation.start()
+
+    def restore(self, board):
+        # rebuild only the tiles that differ from the target board
+        self.finish()
+        rules = self.engine.rules
+        current, target = rules.unpack(self.engine.board), rules.unpack(board)
+        self.engine.load(board)
+        for index, exponent in enumerate(target):
+            if exponent == current[index]:
+                continue
+            row, cell = divmod(index, self.grid)
+            self.pool.release(self.data[row][cell]['data'][0])
+            tile = self.pool.acquire(engine.exponent_to_value(exponent)) if exponent else 0
+            if tile and self.data[row][cell]['position']:
+                tile.setGeometry(QtCore.QRect(self.data[row][cell]['position'].x(),
+                                              self.data[row][cell]['position'].y(),
+                                              int(self.tl), int(self.tl)))
+            self.data[row][cell]['data'] = [tile]
+        self.invalidate()
 
     def check_state(self):
-        # if empty cells exists check passed
-        if len(self.find_empty_cells()) > 0:
-            return True
-        # horizontal check cells for identity
-        for row in range(self.grid):
-            for cell in range(self.grid):
-                if cell:
-                    if self.data[row][cell]['data'][0].value == self.data[row][cell - 1]['data'][0].value:
-                        return True
-        # vertical check cells for identity
-        for row in range(self.grid):
-            for cell in range(self.grid):
-                if row:
-                    if self.data[row][cell]['data'][0].value == self.data[row - 1][cell]['data'][0].value:
-                        return True
-        # result if check not passed
-        return False
+        # (legal directions, 2048 on the board)
+        return self.engine.check()
 
-    def find_2048(self):
-        for row in self.data:
-            for cell in row:
-                if cell['data'][0] != 0:
-                    if cell['data'][0].value == 2048:
-                        return True
-        return False
+
+class FrameStats:
+
+    def __init__(self, period):
+        self.period = period                         # frames between reports, 0 disables
+        self.enabled = period > 0
+        self.frames = 0                              # frames painted
+        self.area = 0                                # pixels painted
+        self.time = 0.0                              # seconds spent painting
+
+    def add(self, seconds, region):
+        self.frames += 1
+        self.time += seconds
+        self.area += sum(rect.width() * rect.height() for rect in region.rects())
+        if self.frames % self.period == 0:
+            sys.stderr.write(self.report() + "\n")
+
+    def report(self):
+        return "frames: %d, area: %d px (%d px/frame), paint: %.3f ms/frame" % (
+            self.frames, self.area, self.area / self.frames, 1000 * self.time / self.frames)
+
+
+class Diagnostics:
+
+    def __init__(self, window, capture_moves, capture_path):
+        self.enabled = False                         # overlay is shown
+        self.moves = deque(maxlen=window)            # processing seconds of recent moves
+        self.paints = deque(maxlen=window)           # seconds of recent paint events
+        self.frames = deque(maxlen=window)           # frames painted per recent move
+        self.move_time = 0.0                         # processing time of the move in flight
+        self.move_frames = 0                         # frames painted since the move started
+        self.capture_moves = capture_moves           # moves per profile capture
+        self.capture_path = capture_path             # pstats file of the capture
+        self.profiler = None                         # running capture
+        self.capture_left = 0                        # moves until the capture is dumped
+
+    def paint(self, seconds):
+        self.paints.append(seconds)
+        self.move_frames += 1
+
+    def begin(self):
+        self.move_frames = 0
+
+    def moved(self):
+        # a move has been processed, returns the pstats path when a capture ends with it
+        self.moves.append(self.move_time)
+        self.frames.append(self.move_frames)
+        self.move_time = 0.0
+        if self.profiler is None:
+            return None
+        self.capture_left -= 1
+        return self.dump() if self.capture_left <= 0 else None
+
+    def capture(self):
+        if self.profiler is not None:
+            return
+        self.profiler = cProfile.Profile()
+        self.capture_left = self.capture_moves
+        self.profiler.enable()
+
+    def dump(self):
+        if self.profiler is None:
+            return None
+        self.profiler.disable()
+        try:
+            self.profiler.dump_stats(self.capture_path)
+        except OSError as error:
+            sys.stderr.write("profile: %s\n" % error)
+        self.profiler = None
+        return self.capture_path
+
+    @staticmethod
+    def rss():
+        # resident set size in bytes, None where it cannot be read
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            pass
+        try:
+            import resource
+        except ImportError:
+            return None
+        # peak instead of current, in kilobytes except on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    @staticmethod
+    def percentiles(samples, scale=1000.0):
+        ordered = sorted(samples)
+        return "p50 %6.2f  p95 %6.2f  p99 %6.2f" % tuple(
+            scale * simulation.percentile(ordered, fraction) for fraction in (0.5, 0.95, 0.99))
+
+    def lines(self, tiles):
+        rss = self.rss()
+        res = ["move   %s ms" % self.percentiles(self.moves),
+               "paint  %s ms" % self.percentiles(self.paints),
+               "frames %.1f/move  tiles %d  rss %s" % (
+                   sum(self.frames) / len(self.frames) if self.frames else 0, tiles,
+                   "%.1f MB" % (rss / 1048576) if rss is not None else "n/a")]
+        if self.profiler is not None:
+            res.append("capture %d / %d moves" % (self.capture_moves - self.capture_left, self.capture_moves))
+        return res
+
+
+class Thinker(QtCore.QObject):
+
+    found = QtCore.pyqtSignal(object)
+
+    def __init__(self, grid):
+        super(Thinker, self).__init__()
+        self.budget = settings.ai_budget
+        self.searcher = ai.Searcher(grid, settings.ai_cache_size, compact=False)
+
+    @QtCore.pyqtSlot(object)
+    def search(self, board):
+        # runs in the worker thread, the result is delivered to the GUI thread
+        self.found.emit(self.searcher.decide(board, self.budget))
+
+
+class Spectator(QtCore.QObject):
+
+    # Follows a session of the game server: sends 'watch' and emits every
+    # state line the server pushes, only the newest of a burst.
+
+    received = QtCore.pyqtSignal(object)
+
+    def __init__(self, address, session):
+        super(Spectator, self).__init__()
+        # only spectating needs sockets, a normal start does not pay for them
+        from PyQt5 import QtNetwork
+        import server
+        self.session = session
+        address = server.parse_address(address)
+        if isinstance(address, tuple):
+            self.socket = QtNetwork.QTcpSocket(self)
+            self.socket.connected.connect(self.watch)
+            self.socket.connectToHost(address[0], address[1])
+        else:
+            self.socket = QtNetwork.QLocalSocket(self)
+            self.socket.connected.connect(self.watch)
+            self.socket.connectToServer(address)
+        self.socket.readyRead.connect(self.read)
+        self.socket.error.connect(lambda *args: self.received.emit({"ok": False, "error": self.socket.errorString()}))
+
+    def watch(self):
+        self.socket.write((json.dumps({"op": "watch", "session": self.session}) + "\n").encode())
+
+    def read(self):
+        latest = None
+        while self.socket.canReadLine():
+            try:
+                latest = json.loads(bytes(self.socket.readLine()))
+            except ValueError:
+                continue
+        if latest is not None:
+            self.received.emit(latest)
+
+    def close(self):
+        self.socket.close()
 
 
 class Canvas(QtWidgets.QWidget):
@@ -289,41 +615,179 @@ class Canvas(QtWidgets.QWidget):
         self.sf = 1
         self.parent = parent
         self.matrix = parent.matrix
+        self.theme = parent.theme
         self.painter = QtGui.QPainter()
-        self.new_button = QtWidgets.QPushButton(cfg.get("Locale", "new"), self)
-        self.new_button.setFocusPolicy(QtCore.Qt.NoFocus)
-        self.new_button.clicked.connect(parent.new_game)
-        self.undo_button = QtWidgets.QPushButton(cfg.get("Locale", "undo"), self)
-        self.undo_button.setFocusPolicy(QtCore.Qt.NoFocus)
-        self.undo_button.clicked.connect(parent.undo)
+        self.matrix.canvas = self
+        self.frames = FrameStats(settings.frame_stats)
+        self.diagnostics = parent.diagnostics
+        self.background = None                       # cached title, playfield and empty cells
+        self.help_font = QtGui.QFont()
+        self.seed_font = QtGui.QFont()
+        self.overlay_font = QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont)
+        self.overlay_timer = QtCore.QTimer(self)     # keeps RSS and capture progress current
+        self.overlay_timer.setInterval(500)
+        self.overlay_timer.timeout.connect(self.update_overlay)
+        self.stats_font = QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont)
+        self.stats_visible = False                   # stats panel covers the playfield
+        self.stats_summary = None                    # latest aggregates of the stats store
+        self.score_font = QtGui.QFont()
+        self.new_button = None                       # buttons are built after the first frame
+        self.undo_button = None
+        self.buttons_style = ""
+        self.painted = False                         # the first frame is on screen
+
+    def build_buttons(self):
         with open('buttons.css', 'r') as css:
             self.buttons_style = css.read()
+        self.new_button = QtWidgets.QPushButton(self.theme.locale["new"], self)
+        self.new_button.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.new_button.clicked.connect(self.parent.new_game)
+        self.undo_button = QtWidgets.QPushButton(self.theme.locale["undo"], self)
+        self.undo_button.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.undo_button.clicked.connect(self.parent.undo)
+        self.place_buttons()
+        self.new_button.show()
+        self.undo_button.show()
 
-    def paintEvent(self, event):
-        # open painter
-        self.painter.begin(self)
-        self.painter.setRenderHints(QtGui.QPainter.Antialiasing | QtGui.QPainter.TextAntialiasing)
+    def place_buttons(self):
+        if self.new_button is None:
+            return
+        sf = self.sf
+        self.new_button.setGeometry(int(20 * sf), int(88 * sf), int(75 * sf), int(25 * sf))
+        self.undo_button.setGeometry(int(115 * sf), int(88 * sf), int(75 * sf), int(25 * sf))
+        dynamic_style = self.buttons_style % (self.theme.grid.name()[1:],
+                                              int(sf * 3),
+                                              self.theme.grid.name()[1:],
+                                              int(sf * 10),
+                                              self.theme.background.name()[1:],
+                                              self.theme.cell.name()[1:],
+                                              self.theme.cell.name()[1:])
+        self.new_button.setStyleSheet(dynamic_style)
+        self.undo_button.setStyleSheet(dynamic_style)
+
+    def playfield(self):
+        return QtCore.QRect(int(self.sf * 20), int(self.sf * 130), int(self.sf * 170), int(self.sf * 170))
+
+    def build_background(self):
+        ratio = self.devicePixelRatioF()
+        self.background = QtGui.QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+        self.background.setDevicePixelRatio(ratio)
+        self.background.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(self.background)
+        painter.setRenderHints(QtGui.QPainter.Antialiasing | QtGui.QPainter.TextAntialiasing)
         # draw title
-        self.painter.setPen(QtGui.QColor("#" + cfg.get("Appearance", "color.text.dark")))
+        painter.setPen(self.theme.text_dark)
         font = QtGui.QFont()
         font.setPixelSize(int(self.sf * 30))
-        self.painter.setFont(font)
-        self.painter.drawText(int(self.sf * 20), int(self.sf * 45), cfg.get("Locale", "subtitle"))
+        painter.setFont(font)
+        painter.drawText(int(self.sf * 20), int(self.sf * 45), self.theme.locale["subtitle"])
+        # draw boundary of the playing field
+        painter.setPen(self.theme.grid)
+        painter.setBrush(self.theme.grid)
+        painter.drawRoundedRect(self.playfield(), int(self.sf * 3), int(self.sf * 3), QtCore.Qt.AbsoluteSize)
+        # draw grid of playing field
+        painter.setPen(self.theme.cell)
+        painter.setBrush(self.theme.cell)
+        ln, sp = 150.0 / self.matrix.grid, 20.0 / (self.matrix.grid + 1)
+        for y in range(self.matrix.grid):
+            for x in range(self.matrix.grid):
+                painter.drawRoundedRect(int(self.sf * (20 + (x + 1) * sp + x * ln)),
+                                        int(self.sf * (130 + (y + 1) * sp + y * ln)),
+                                        int(self.sf * ln),
+                                        int(self.sf * ln),
+                                        int(self.sf * 3), int(self.sf * 3),
+                                        QtCore.Qt.AbsoluteSize)
+        painter.end()
+
+    def header(self):
+        return QtCore.QRect(0, 0, self.width(), int(self.sf * 85))
+
+    def overlay(self):
+        return QtCore.QRect(int(self.sf * 22), int(self.sf * 132), int(self.sf * 166), int(self.sf * 36))
+
+    def show_overlay(self, enabled):
+        self.diagnostics.enabled = enabled
+        if enabled:
+            self.overlay_timer.start()
+        else:
+            self.overlay_timer.stop()
+        self.update(self.overlay())
+
+    def update_overlay(self):
+        if self.diagnostics.enabled:
+            self.update(self.overlay())
+
+    def show_stats(self, enabled):
+        self.stats_visible = enabled
+        if enabled:
+            self.parent.query_stats()
+        self.update(self.playfield())
+
+    def stats_received(self, summary):
+        self.stats_summary = summary
+        if self.stats_visible:
+            self.update(self.playfield())
+
+    def paintEvent(self, event):
+        start_time = time.perf_counter()
+        exposed = event.rect()
+        # open painter
+        self.painter.begin(self)
+        self.painter.setRenderHints(QtGui.QPainter.Antialiasing | QtGui.QPainter.TextAntialiasing |
+                                    QtGui.QPainter.SmoothPixmapTransform)
+        # draw static layer
+        if self.background:
+            self.painter.drawPixmap(0, 0, self.background)
+        # draw texts when they are exposed
+        if exposed.intersects(self.header()):
+            self.paint_header()
+        # draw existing tiles in the exposed area
+        for tile in self.matrix.to_render(exposed):
+            if exposed.intersects(tile.getGeometry()):
+                tile.render(self.painter)
+        # draw shadow if state is 'lose'
+        if self.parent.state == 'lose':
+            self.painter.setPen(self.theme.shadow)
+            self.painter.setBrush(self.theme.shadow)
+            self.painter.drawRoundedRect(self.playfield(), int(self.sf * 3), int(self.sf * 3), QtCore.Qt.AbsoluteSize)
+        # draw stats panel over the playfield
+        if self.stats_visible and exposed.intersects(self.playfield()):
+            self.paint_stats()
+        # draw diagnostics above everything else
+        if self.diagnostics.enabled and exposed.intersects(self.overlay()):
+            self.paint_overlay()
+        # close painter
+        self.painter.end()
+        elapsed = time.perf_counter() - start_time
+        self.diagnostics.paint(elapsed)
+        if self.frames.enabled:
+            self.frames.add(elapsed, event.region())
+        if not self.painted:
+            self.painted = True
+            self.parent.timings.append(("first paint", time.perf_counter()))
+            QtCore.QTimer.singleShot(0, self.parent.start)
+
+    def paint_header(self):
+        # draw seed of the game under the title
+        self.painter.setPen(self.theme.text_dark)
+        self.painter.setFont(self.seed_font)
+        self.painter.drawText(QtCore.QRect(int(self.sf * 21), int(self.sf * 48), int(self.sf * 90), int(self.sf * 10)),
+                              QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop,
+                              "%s %d" % (self.theme.locale["seed"], self.matrix.engine.rng.seed))
         # draw help line
-        font.setPixelSize(int(self.sf * 9))
-        self.painter.setFont(font)
+        self.painter.setFont(self.help_font)
         text_line_rect = QtCore.QRect(int(self.sf * 20), int(self.sf * 65), int(self.sf * 170), int(self.sf * 20))
         if self.parent.state == "win":
-            self.painter.drawText(text_line_rect, QtCore.Qt.AlignHCenter, cfg.get("Locale", "win"))
+            self.painter.drawText(text_line_rect, QtCore.Qt.AlignHCenter, self.theme.locale["win"])
         elif self.parent.state == "lose":
-            self.painter.drawText(text_line_rect, QtCore.Qt.AlignHCenter, cfg.get("Locale", "lose"))
+            self.painter.drawText(text_line_rect, QtCore.Qt.AlignHCenter, self.theme.locale["lose"])
         else:
-            self.painter.drawText(text_line_rect, QtCore.Qt.AlignHCenter, cfg.get("Locale", "help"))
+            self.painter.drawText(text_line_rect, QtCore.Qt.AlignHCenter,
+                                  self.parent.status or self.theme.locale["help"])
         # draw score and best
-        st = " %s\n%s" % (cfg.get("Locale", "score"), self.parent.score)
-        hst = " %s\n%s" % (cfg.get("Locale", "best"), self.parent.highscore)
-        font.setPixelSize(int(self.sf * 10))
-        self.painter.setFont(font)
+        st = " %s\n%s" % (self.theme.locale["score"], self.parent.score)
+        hst = " %s\n%s" % (self.theme.locale["best"], self.parent.highscore)
+        self.painter.setFont(self.score_font)
         sbr = self.painter.boundingRect(self.geometry(), QtCore.Qt.TextWordWrap, st)
         hsbr = self.painter.boundingRect(self.geometry(), QtCore.Qt.TextWordWrap, hst)
         sr = QtCore.QRect(int(self.sf * 180) - sbr.width() - hsbr.width() - int((15 * self.sf)),
@@ -334,139 +798,472 @@ class Canvas(QtWidgets.QWidget):
                            int(self.sf * 20),
                            hsbr.width() + int(self.sf * 10),
                            hsbr.height() + int(self.sf * 6))
-        self.painter.setPen(QtGui.QColor("#" + cfg.get("Appearance", "color.grid")))
-        self.painter.setBrush(QtGui.QColor("#" + cfg.get("Appearance", "color.grid")))
+        self.painter.setPen(self.theme.grid)
+        self.painter.setBrush(self.theme.grid)
         self.painter.drawRoundedRect(sr, int(self.sf * 3), int(self.sf * 3), QtCore.Qt.AbsoluteSize)
         self.painter.drawRoundedRect(hsr, int(self.sf * 3), int(self.sf * 3), QtCore.Qt.AbsoluteSize)
-        self.painter.setPen(QtGui.QColor("#" + cfg.get("Appearance", "color.background")))
+        self.painter.setPen(self.theme.background)
         self.painter.drawText(sr, QtCore.Qt.AlignVCenter | QtCore.Qt.AlignHCenter, st)
         self.painter.drawText(hsr, QtCore.Qt.AlignVCenter | QtCore.Qt.AlignHCenter, hst)
-        # draw boundary of the playing field
-        self.painter.setPen(QtGui.QColor("#" + cfg.get("Appearance", "color.grid")))
-        self.painter.setBrush(QtGui.QColor("#" + cfg.get("Appearance", "color.grid")))
-        playfield = QtCore.QRect(int(self.sf * 20), int(self.sf * 130), int(self.sf * 170), int(self.sf * 170))
-        self.painter.drawRoundedRect(playfield, int(self.sf * 3), int(self.sf * 3), QtCore.Qt.AbsoluteSize)
-        # draw grid of playing field
-        self.painter.setPen(QtGui.QColor("#" + cfg.get("Appearance", "color.cell")))
-        self.painter.setBrush(QtGui.QColor("#" + cfg.get("Appearance", "color.cell")))
-        ln, sp = 150.0 / self.matrix.grid, 20.0 / (self.matrix.grid + 1)
-        for y in range(self.matrix.grid):
-            for x in range(self.matrix.grid):
-                self.painter.drawRoundedRect(int(self.sf * (20 + (x + 1) * sp + x * ln)),
-                                             int(self.sf * (130 + (y + 1) * sp + y * ln)),
-                                             int(self.sf * ln),
-                                             int(self.sf * ln),
-                                             int(self.sf * 3), int(self.sf * 3),
-                                             QtCore.Qt.AbsoluteSize)
-        # draw all existing tiles
-        for tile in self.matrix.to_render():
-            tile.render(self.painter)
-        # draw shadow if state is 'lose'
-        if self.parent.state == 'lose':
-            self.painter.setPen(QtGui.QColor(187, 173, 160, 100))
-            self.painter.setBrush(QtGui.QColor(187, 173, 160, 100))
-            self.painter.drawRoundedRect(playfield, int(self.sf * 3), int(self.sf * 3), QtCore.Qt.AbsoluteSize)
-        # close painter
-        self.painter.end()
+
+    def paint_overlay(self):
+        rect = self.overlay()
+        self.painter.setPen(QtCore.Qt.NoPen)
+        self.painter.setBrush(QtGui.QColor(0, 0, 0, 160))
+        self.painter.drawRect(rect)
+        self.painter.setPen(self.theme.text_light)
+        self.painter.setFont(self.overlay_font)
+        self.painter.drawText(rect.adjusted(int(self.sf * 2), int(self.sf), 0, 0), QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop,
+                              "\n".join(self.diagnostics.lines(self.matrix.pool.live())))
+
+    def stats_lines(self):
+        lines = ["%s  %dx%d" % (self.theme.locale["stats"], self.matrix.grid, self.matrix.grid), ""]
+        summary = self.stats_summary
+        if summary is None:
+            return lines + ["..."]
+        score = summary["score"]
+        lines += ["games %-8d best %d" % (summary["games"], score["max"]),
+                  "mean  %-8d mv/s %.1f" % (score["mean"], summary["moves_per_sec"]),
+                  "p50   %-8d p90  %d" % (score["p50"], score["p90"]),
+                  "p99   %d" % score["p99"],
+                  ""]
+        # the highest max tiles, share of games in percents
+        for tile, games in sorted(summary["max_tile"].items(), key=lambda item: -int(item[0]))[:8]:
+            lines.append("%6s %6d %5.1f%%" % (tile, games, 100.0 * games / summary["games"]))
+        return lines
+
+    def paint_stats(self):
+        rect = self.playfield()
+        self.painter.setPen(QtCore.Qt.NoPen)
+        color = QtGui.QColor(self.theme.background)
+        color.setAlpha(235)
+        self.painter.setBrush(color)
+        self.painter.drawRoundedRect(rect, int(self.sf * 3), int(self.sf * 3), QtCore.Qt.AbsoluteSize)
+        self.painter.setPen(self.theme.text_dark)
+        self.painter.setFont(self.stats_font)
+        self.painter.drawText(rect.adjusted(int(self.sf * 8), int(self.sf * 6), 0, 0),
+                              QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop, "\n".join(self.stats_lines()))
 
     def resizeEvent(self, ev):
-        sf = ev.size().width() / float(cfg.get("Appearance", "min.width"))  # scale factor
+        sf = ev.size().width() / settings.min_width  # scale factor
         self.sf = sf
         self.matrix.sf = sf
         self.matrix.update()
-        self.new_button.setGeometry(int(20 * sf), int(88 * sf), int(75 * sf), int(25 * sf))
-        self.undo_button.setGeometry(int(115 * sf), int(88 * sf), int(75 * sf), int(25 * sf))
-        dynamic_style = self.buttons_style % (cfg.get("Appearance", "color.grid"),
-                                              int(sf * 3),
-                                              cfg.get("Appearance", "color.grid"),
-                                              int(sf * 10),
-                                              cfg.get("Appearance", "color.background"))
-        self.new_button.setStyleSheet(dynamic_style)
-        self.undo_button.setStyleSheet(dynamic_style)
+        self.theme.scale(sf, self.matrix.tl, self.devicePixelRatioF())
+        self.help_font.setPixelSize(int(sf * 9))
+        self.seed_font.setPixelSize(max(1, int(sf * 6)))
+        self.score_font.setPixelSize(int(sf * 10))
+        self.overlay_font.setPixelSize(max(1, int(sf * 6)))
+        self.stats_font.setPixelSize(max(1, int(sf * 8)))
+        self.build_background()
+        self.place_buttons()
 
 
 class Main(QtWidgets.QWidget):
 
-    def __init__(self):
+    think_request = QtCore.pyqtSignal(object)
+    stats_ready = QtCore.pyqtSignal(object)
+    arrows = {engine.LEFT: "\u2190", engine.UP: "\u2191", engine.RIGHT: "\u2192", engine.DOWN: "\u2193"}
+    # bit widths of moves, seed, draws, recorded flag and play time in ms in an undo snapshot
+    SNAPSHOT_WIDTHS = (32, 64, 64, 1, 40)
+
+    def __init__(self, seed=None, spectate=None):
         super(Main, self).__init__()
-        self.setMinimumSize(int(cfg.get("Appearance", "min.width")), int(cfg.get("Appearance", "min.height")))
-        self.resize(int(cfg.get("Window", "width")), int(cfg.get("Window", "height")))
+        self.setMinimumSize(settings.min_width, settings.min_height)
+        self.resize(settings.width, settings.height)
         center_point = QtWidgets.QDesktopWidget().availableGeometry().center()
         qtrect = self.geometry()
         qtrect.moveCenter(center_point)
         self.move(qtrect.topLeft())
-        self.setWindowTitle(cfg.get("Locale", "title"))
+        self.theme = Theme()
+        self.setWindowTitle(self.theme.locale["title"])
         self.setAutoFillBackground(True)
         pallete = self.palette()
-        pallete.setColor(self.backgroundRole(), QtGui.QColor("#" + cfg.get("Appearance", "color.background")))
+        pallete.setColor(self.backgroundRole(), self.theme.background)
         self.setPalette(pallete)
         self.state = "playing"
-        self.score = int(cfg.get("Game", "score"))
-        self.highscore = int(cfg.get("Game", "highscore"))
-        self.previous_score = 0
-        self.previous_matrix = None
+        self.legal = engine.LEGAL[15]                # directions that would change the board
+        self.score = settings.score
+        self.highscore = settings.highscore
+        self.keys = {QtCore.Qt.Key_Left: engine.LEFT,
+                     QtCore.Qt.Key_Right: engine.RIGHT,
+                     QtCore.Qt.Key_Up: engine.UP,
+                     QtCore.Qt.Key_Down: engine.DOWN}
+        self.queue = deque()
+        self.autoplay = False                        # moves are made by the AI
+        self.status = ""                             # help line override: hints, replay position
+        self.thinker = None                          # expectimax worker, started on demand
+        self.thinker_thread = None
+        self.thinking = False                        # a search request is in flight
+        self.rethink = False                         # board changed during the search
+        self.diagnostics = Diagnostics(settings.overlay_window, settings.capture_moves, settings.capture_path)
         self.matrix = Matrix(self)
+        self.history = engine.History(self.matrix.engine.rules, settings.undo_limit, self.SNAPSHOT_WIDTHS)
+        self.matrix.animation.finished.connect(self.moved)
+        self.journal = journal.Journal(settings.journal_path,
+                                       self.matrix.engine.rules,
+                                       settings.journal_checkpoint,
+                                       settings.journal_sync_moves,
+                                       settings.journal_sync_interval / 1000)
+        self.autosave = autosave.Autosave(settings.autosave_path,
+                                          self.matrix.engine.rules,
+                                          settings.autosave_interval / 1000,
+                                          settings.autosave_moves)
+        self.stats = stats.Store(settings.stats_path, settings.stats_batch, settings.stats_interval / 1000)
+        self.moves = 0                               # moves of the game, undone ones excluded
+        self.played = 0.0                            # seconds the game was played before 'game_time'
+        self.game_time = time.monotonic()            # start of the game, or of its resume in this window
+        self.recorded = False                        # the game is in the stats store
+        self.replay = None                           # journal reader while replaying
+        self.replay_position = 0
+        self.live = None                             # (board, score) to return to after replay
         self.canvas = Canvas(self)
+        self.stats_ready.connect(self.canvas.stats_received)
+        self.started = False                         # save restored, see 'start'
+        self.start_seed = seed                       # seed of a new game instead of the save
+        self.spectate = spectate                     # (server address, session) to follow
+        self.spectator = None                        # connection to the server while following
+        self.timings = [("import", import_time), ("config", config_time), ("window", time.perf_counter())]
         self.show()
-        if not self.matrix.save_loaded:
-            self.score = 0
-            self.matrix.spawn()
+
+    def start(self):
+        # everything the first frame does not need, called once it is painted
+        if self.started:
+            return
+        self.started = True
+        self.canvas.build_buttons()
+        self.canvas.show_overlay(settings.overlay)
+        if self.spectate:
+            # a view of someone else's game: no input, no saves
+            self.spectator = Spectator(*self.spectate)
+            self.update_buttons()
+            self.spectator.received.connect(self.spectated)
+            return
+        saved = self.autosave.load()
+        if saved:
+            self.highscore = max(self.highscore, saved.highscore)
+        if self.start_seed is not None:
+            # an explicit seed always begins a new game
+            saved = restored = None
+        else:
+            restored = self.journal.restore()
+        if restored:
+            # the journal is never older than the autosave
+            board, self.score, seed, draws, self.moves = restored
+            if saved and saved.seed == seed:
+                self.played = saved.played
+            self.matrix.engine.reseed(seed, draws)
+            self.matrix.restore(board)
+        else:
+            if saved and saved.board is not None:
+                self.score, self.moves, self.played = saved.score, saved.moves, saved.played
+                self.matrix.engine.reseed(saved.seed, saved.draws)
+                self.matrix.restore(saved.board)
+            elif self.start_seed is not None or not self.restore_legacy():
+                self.score = 0
+                self.matrix.engine.reseed(self.start_seed)
+                self.matrix.spawn()
+            self.journal.start(self.matrix.engine.board, self.score, *self.generator(), self.moves)
+        self.game_time = time.monotonic()
+        self.check_state()
+        self.save()
+        # a lost game was recorded when it ended
+        self.recorded = self.state == "lose"
+        self.timings.append(("restore", time.perf_counter()))
+        if settings.startup_report:
+            sys.stderr.write(json.dumps(self.startup_report()) + "\n")
+
+    def restore_legacy(self):
+        # the board older versions kept in settings.ini, False when there is none
+        if len(settings.save) != self.matrix.grid ** 2 or not any(settings.save):
+            return False
+        try:
+            board = self.matrix.engine.rules.from_values(settings.save)
+        except ValueError as error:
+            sys.stderr.write("settings: save ignored, %s\n" % error)
+            return False
+        self.matrix.restore(board)
+        return True
+
+    def spectated(self, message):
+        if not message.get("ok"):
+            self.status = message.get("error", "")
+        elif message.get("grid") != self.matrix.grid:
+            self.status = "grid %s != %s" % (message.get("grid"), self.matrix.grid)
+        else:
+            self.score = message["score"]
+            self.matrix.engine.reseed(message["seed"])
+            self.matrix.restore(self.matrix.engine.rules.from_values(message["board"]))
+            self.status = "%s %s: %d" % (self.theme.locale["session"], message["session"], message["moves"])
+            self.check_state()
+        self.canvas.update(self.canvas.header())
+
+    def generator(self):
+        # (seed, draws) of the game, enough to continue its spawns
+        rng = self.matrix.engine.rng
+        return rng.seed, rng.draws
+
+    def snapshot_fields(self):
+        # the game an undo snapshot belongs to, in SNAPSHOT_WIDTHS order
+        return (self.moves, *self.generator(), self.recorded, int(self.play_time() * 1000))
+
+    def play_time(self):
+        # seconds the game has been open, over all windows it was resumed in
+        return self.played + time.monotonic() - self.game_time
+
+    def save(self):
+        if self.spectator:
+            return
+        self.autosave.update(self.matrix.engine.board, self.score, self.highscore, *self.generator(),
+                             self.moves, self.play_time())
+
+    def record(self, outcome):
+        # hand a finished game to the stats store, once
+        if self.spectator or self.recorded or not self.moves:
+            return
+        self.recorded = True
+        game = self.matrix.engine
+        self.stats.record(stats.game(self.matrix.grid, game.rng.seed, self.score,
+                                     engine.exponent_to_value(game.max_exponent()), self.moves,
+                                     self.play_time(), "window", outcome))
+        if self.canvas.stats_visible:
+            self.query_stats()
+
+    def query_stats(self):
+        # answered on the store thread, the signal brings the result back
+        self.stats.query(self.stats_ready.emit, self.matrix.grid)
+
+    def startup_report(self):
+        # milliseconds since the start of the game module
+        return {"startup_ms": {name: round(1000 * (moment - startup_time), 3) for name, moment in self.timings},
+                "config_cached": settings.cached}
 
     def keyPressEvent(self, event):
-        if self.state == "lose":
+        if event.isAutoRepeat() or not self.started:
+            return
+        if self.spectator and event.key() not in (QtCore.Qt.Key_D, QtCore.Qt.Key_P, QtCore.Qt.Key_S):
+            return
+        if self.replay:
+            self.replay_key(event.key())
+        elif event.key() == QtCore.Qt.Key_R:
+            self.enter_replay()
+        elif event.matches(QtGui.QKeySequence.Undo):
+            self.undo()
+        elif event.matches(QtGui.QKeySequence.Redo):
+            self.redo()
+        elif event.key() == QtCore.Qt.Key_D:
+            self.canvas.show_overlay(not self.diagnostics.enabled)
+        elif event.key() == QtCore.Qt.Key_P:
+            self.diagnostics.capture()
+            self.canvas.update_overlay()
+        elif event.key() == QtCore.Qt.Key_S:
+            self.canvas.show_stats(not self.canvas.stats_visible)
+        elif self.state == "lose":
             return
-        if not event.isAutoRepeat():
+        elif event.key() == QtCore.Qt.Key_H:
+            self.think()
+        elif event.key() == QtCore.Qt.Key_A:
+            self.autoplay = not self.autoplay
+            if self.autoplay:
+                self.think()
+            else:
+                self.status = ""
+                self.canvas.update(self.canvas.header())
+        elif event.key() in self.keys:
+            if not self.queue and not self.matrix.animating() and self.keys[event.key()] not in self.legal:
+                # nothing would move: no backup, no snapped animations
+                return
+            self.queue.append(self.keys[event.key()])
+            if self.matrix.animating():
+                # the pending move starts from the finished handler
+                self.matrix.finish()
+            else:
+                self.next_move()
+
+    def next_move(self):
+        while self.queue and self.state != "lose" and not self.matrix.animating():
+            start_time = time.perf_counter()
             self.matrix.modified = False
-            self.previous_matrix = self.matrix.backup()
-            self.previous_score = self.score
-            if event.key() == QtCore.Qt.Key_Left:
-                self.matrix.merge()
-            elif event.key() == QtCore.Qt.Key_Up:
-                self.matrix.rotateLeft()
-                self.matrix.merge()
-                self.matrix.rotateRight()
-            elif event.key() == QtCore.Qt.Key_Right:
-                self.matrix.reverse()
-                self.matrix.merge()
-                self.matrix.reverse()
-            elif event.key() == QtCore.Qt.Key_Down:
-                self.matrix.rotateRight()
-                self.matrix.merge()
-                self.matrix.rotateLeft()
+            board = self.matrix.engine.board
+            self.diagnostics.begin()
+            self.matrix.merge(self.queue.popleft())
             if self.matrix.modified:
-                self.matrix.collect()
-                self.matrix.spawn()
-                self.check_state()
+                self.history.push(board, self.score, self.snapshot_fields())
+                self.diagnostics.move_time += time.perf_counter() - start_time
+        if self.state == "lose":
+            self.queue.clear()
+
+    def moved(self):
+        start_time = time.perf_counter()
+        self.matrix.release(self.matrix.animation)
+        self.matrix.collect()
+        index, exponent = self.matrix.spawn()
+        self.moves += 1
+        self.journal.append(self.matrix.direction, index, exponent, self.matrix.engine.board, self.score,
+                            self.matrix.engine.rng.draws, self.moves)
+        self.check_state()
+        self.save()
+        if self.state == "lose":
+            self.record("lost")
+        self.diagnostics.move_time += time.perf_counter() - start_time
+        captured = self.diagnostics.moved()
+        if self.diagnostics.enabled:
+            self.canvas.update_overlay()
+        self.next_move()
+        if self.autoplay and not self.queue:
+            self.think()
+        elif not self.autoplay:
+            self.status = ""
+        if captured:
+            self.status = "%s: %s" % (self.theme.locale["profile"], captured)
+            self.canvas.update(self.canvas.header())
+
+    def think(self):
+        if self.state == "lose":
+            return
+        if self.thinker is None:
+            self.thinker = Thinker(self.matrix.grid)
+            self.thinker_thread = QtCore.QThread()
+            self.thinker.moveToThread(self.thinker_thread)
+            self.think_request.connect(self.thinker.search)
+            self.thinker.found.connect(self.thought)
+            self.thinker_thread.start()
+        if self.thinking:
+            self.rethink = True
+            return
+        self.thinking = True
+        self.think_request.emit(self.matrix.engine.board)
+
+    def thought(self, decision):
+        self.thinking = False
+        if self.rethink or decision.board != self.matrix.engine.board:
+            # the board has changed since the request, the result is stale
+            self.rethink = False
+            if self.autoplay:
+                self.think()
+            return
+        if decision.direction is None:
+            self.autoplay = False
+            return
+        label = self.theme.locale["auto" if self.autoplay else "hint"]
+        self.status = "%s: %s  %d nodes/s  %d%% cache" % (
+            label, self.arrows[decision.direction],
+            decision.nodes / decision.elapsed if decision.elapsed else 0,
+            100 * decision.hits / decision.lookups if decision.lookups else 0)
+        self.canvas.update(self.canvas.header())
+        if self.autoplay:
+            self.queue.append(decision.direction)
+            if not self.matrix.animating():
+                self.next_move()
+
+    def stop(self):
+        # drop buffered input, settle running animations and leave replay
+        self.queue.clear()
+        self.matrix.finish()
+        if self.replay:
+            self.leave_replay()
+
+    def enter_replay(self):
+        self.stop()
+        self.autoplay = False
+        self.journal.sync()
+        self.replay = journal.Replay(self.journal.path, self.matrix.engine.rules)
+        if not self.replay.positions:
+            self.replay = None
+            return
+        self.live = (self.matrix.engine.board, self.score)
+        self.seek(self.replay.length)
+
+    def leave_replay(self):
+        self.replay = None
+        self.status = ""
+        board, self.score = self.live
+        self.matrix.restore(board)
+        self.check_state()
+
+    def replay_key(self, key):
+        steps = {QtCore.Qt.Key_Left: -1, QtCore.Qt.Key_Right: 1,
+                 QtCore.Qt.Key_Down: -10, QtCore.Qt.Key_Up: 10,
+                 QtCore.Qt.Key_Home: -self.replay.length, QtCore.Qt.Key_End: self.replay.length}
+        if key in steps:
+            self.seek(self.replay_position + steps[key])
+        elif key in (QtCore.Qt.Key_R, QtCore.Qt.Key_Escape):
+            self.leave_replay()
+
+    def seek(self, position):
+        self.replay_position = max(0, min(position, self.replay.length))
+        board, self.score, _, _ = self.replay.state_at(self.replay_position)
+        self.matrix.restore(board)
+        self.status = "%s: %d / %d" % (self.theme.locale["replay"], self.replay_position, self.replay.length)
+        self.check_state()
 
     def new_game(self):
-        self.previous_score = self.score
-        self.previous_matrix = self.matrix.backup()
+        self.stop()
+        self.record("abandoned")
+        self.history.push(self.matrix.engine.board, self.score, self.snapshot_fields())
         self.score = 0
         self.state = "playing"
         self.matrix.fill()
         self.matrix.update()
+        self.matrix.engine.reseed()
         self.matrix.spawn()
+        self.journal.start(self.matrix.engine.board, self.score, *self.generator())
+        self.recorded = False
+        self.moves, self.played = 0, 0.0
+        self.game_time = time.monotonic()
+        self.check_state()
+        self.save()
 
     def undo(self):
-        if self.previous_matrix:
-            self.matrix.data = self.previous_matrix
-            self.score = self.previous_score
-            self.matrix.update()
-            self.check_state()
-            self.previous_matrix = None
+        self.stop()
+        self.jump(self.history.undo(self.matrix.engine.board, self.score, self.snapshot_fields()))
+
+    def redo(self):
+        self.stop()
+        self.jump(self.history.redo(self.matrix.engine.board, self.score, self.snapshot_fields()))
+
+    def jump(self, snapshot):
+        if snapshot is None:
+            return
+        board, self.score, (self.moves, seed, draws, recorded, played) = snapshot
+        self.matrix.restore(board)
+        if seed == self.matrix.engine.rng.seed:
+            self.journal.checkpoint(board, self.score, self.matrix.engine.rng.draws, self.moves)
+        else:
+            # back over a restart: the other game continues its own spawns,
+            # outcome and play time
+            self.matrix.engine.reseed(seed, draws)
+            self.recorded = bool(recorded)
+            self.played, self.game_time = played / 1000, time.monotonic()
+            self.journal.start(board, self.score, seed, draws, self.moves)
+        self.check_state()
+        self.save()
 
     def check_state(self):
-        if self.matrix.check_state() is False:
+        state = self.state
+        self.legal, won = self.matrix.check_state()
+        if not self.legal:
             self.state = "lose"
-        elif self.matrix.find_2048():
+        elif won:
             self.state = "win"
         else:
             self.state = "playing"
-        self.update()
+        self.update_buttons()
+        # the 'lose' shadow covers the playfield, otherwise only texts change
+        if self.state != state:
+            self.canvas.update()
+        else:
+            self.canvas.update(self.canvas.header())
+
+    def update_buttons(self):
+        if self.canvas.new_button is None:
+            return
+        self.canvas.new_button.setEnabled(self.spectator is None)
+        self.canvas.undo_button.setEnabled(self.spectator is None and self.history.can_undo())
 
     def resizeEvent(self, event):
         new_size = event.size()
-        ar = float(cfg.get("Appearance", "aspect.ratio"))
+        ar = settings.aspect_ratio
         if new_size.width() != event.oldSize().width():
             new_width = new_size.width()
             new_height = int(new_width / ar)
@@ -483,28 +1280,69 @@ class Main(QtWidgets.QWidget):
         self.canvas.move(int((self.width() - new_width) / 2), int((self.height() - new_height) / 2))
 
     def closeEvent(self, event):
-        data = []
-        tiles_count = 0
-        for row in self.matrix.data:
-            for cell in row:
-                if cell['data'][0] == 0:
-                    data.append(0)
-                else:
-                    data.append(cell['data'][0].value)
-                    tiles_count += 1
-        if tiles_count == 1:
-            data = []
-        cfg.set("Game", "save", " ".join(map(str, data)))
-        cfg.set("Game", "score", str(self.score))
-        cfg.set("Game", "highscore", str(self.highscore))
-        cfg.set("Window", "width", str(self.canvas.width()))
-        cfg.set("Window", "height", str(self.canvas.height()))
-        with open('settings.ini', 'w') as target:
-            cfg.write(target)
+        if self.thinker_thread:
+            self.autoplay = False
+            self.thinker_thread.quit()
+            self.thinker_thread.wait()
+        self.stop()
+        self.diagnostics.dump()
+        if self.spectator:
+            self.spectator.close()
+        self.journal.close()
+        if self.started:
+            # closed before the save was restored, it is kept as it is
+            self.save()
+        self.autosave.close()
+        self.stats.close()
+        settings.set("width", self.canvas.width())
+        settings.set("height", self.canvas.height())
+        settings.write()
         event.accept()
 
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=settings.locale["title"])
+    parser.add_argument("--simulate", metavar="N", type=int,
+                        help="play N games headless and print statistics as JSON lines")
+    parser.add_argument("--policy", choices=sorted(simulation.POLICIES), default="random",
+                        help="move policy of simulated games")
+    parser.add_argument("--workers", metavar="K", type=int, default=multiprocessing.cpu_count(),
+                        help="processes to spread simulated games over")
+    parser.add_argument("--seed", type=int,
+                        help="start a new game with this seed, or the base seed of simulated games (0)")
+    parser.add_argument("--report", metavar="M", type=int, default=0,
+                        help="print statistics every M finished games")
+    parser.add_argument("--spectate", metavar="SESSION", type=int,
+                        help="follow a session of the game server (server.py) instead of playing")
+    parser.add_argument("--server", metavar="ADDRESS", default=settings.server_address,
+                        help="host:port or Unix socket path of the game server (default %(default)s)")
+    parser.add_argument("--record", action="store_true",
+                        help="add simulated games to the stats store")
+    parser.add_argument("--stats", action="store_true",
+                        help="print aggregates of the stats store for the grid as JSON and exit")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print startup timings as a JSON line to stderr")
+    args, qt_args = parser.parse_known_args(argv)
+    # seeds are kept in 64-bit fields of the save and the journal
+    if args.seed is not None and not 0 <= args.seed <= engine.MASK64:
+        parser.error("--seed must be 0-%d" % engine.MASK64)
+    return args, qt_args
+
+
 if __name__ == "__main__":
-    app = QtWidgets.QApplication(sys.argv)
-    game = Main()
+    args, qt_args = parse_args(sys.argv[1:])
+    if args.stats:
+        sys.exit(stats.main(["--db", settings.stats_path, "--grid", str(settings.grid)]))
+    if args.simulate:
+        store = None
+        if args.record:
+            store = stats.Store(settings.stats_path, settings.stats_batch, settings.stats_interval / 1000)
+        simulation.run(args.simulate, args.policy, args.workers, settings.grid,
+                       args.seed or 0, args.report, store=store)
+        if store:
+            store.close()
+        sys.exit(0)
+    settings.startup_report = settings.startup_report or args.startup_report
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
+    game = Main(args.seed, (args.server, args.spectate) if args.spectate is not None else None)
     sys.exit(app.exec_())
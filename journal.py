@@ -0,0 +1,201 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Append-only game journal. Every move is a fixed-size record (direction,
+# spawned exponent, spawn cell, generator draws) in '<path>'; full boards
+# are checkpointed into '<path>.idx' after a header with the game seed every
+# few moves and whenever the game jumps (new game, undo, redo). A writer thread does all file I/O and fsyncs in batches,
+# checkpoints are only written once the records they point at are on disk.
+
+
+# import standard
+import os
+import sys
+import time
+import queue
+import struct
+import bisect
+import threading
+
+RECORD = struct.Struct("<BBHQ")                      # direction, exponent, cell index, generator draws
+HEADER = struct.Struct("<4sHQ")                      # magic, grid resolution, seed
+CHECKPOINT = struct.Struct("<QQQQ")                  # record position, score, generator draws, moves
+MAGIC = b"JNL3"
+
+
+class Replay:
+
+    def __init__(self, path, rules):
+        self.rules = rules
+        self.seed = None                             # seed of the journaled game
+        self.positions = []                          # record position of every checkpoint
+        self.states = []                             # (board, score, draws, moves) of every checkpoint
+        self.records = b""
+        self.length = 0                              # complete records count
+        try:
+            with open(path + ".idx", "rb") as index:
+                self.read_index(index.read())
+            with open(path, "rb") as records:
+                self.records = records.read()
+        except OSError:
+            return
+        self.length = len(self.records) // RECORD.size
+        # checkpoints written ahead of their records are not trusted
+        while self.positions and self.positions[-1] > self.length:
+            self.positions.pop()
+            self.states.pop()
+
+    def read_index(self, data):
+        if len(data) < HEADER.size or HEADER.unpack_from(data)[:2] != (MAGIC, self.rules.grid):
+            return
+        self.seed = HEADER.unpack_from(data)[2]
+        size = CHECKPOINT.size + self.rules.size
+        for offset in range(HEADER.size, len(data) - size + 1, size):
+            position, score, draws, moves = CHECKPOINT.unpack_from(data, offset)
+            try:
+                board = self.rules.pack(data[offset + CHECKPOINT.size:offset + size])
+            except ValueError:
+                # not a board of these rules, later checkpoints are not trusted either
+                return
+            self.positions.append(position)
+            self.states.append((board, score, draws, moves))
+
+    def record(self, position):
+        return RECORD.unpack_from(self.records, position * RECORD.size)
+
+    def apply(self, board, score, position):
+        direction, exponent, index, draws = self.record(position)
+        board, gained = self.rules.move(board, direction)
+        return self.rules.put(board, index, exponent), score + gained, draws
+
+    def state_at(self, position):
+        # nearest checkpoint by binary search, then the records after it
+        checkpoint = bisect.bisect_right(self.positions, position) - 1
+        if checkpoint < 0:
+            return None
+        board, score, draws, moves = self.states[checkpoint]
+        for current in range(self.positions[checkpoint], min(position, self.length)):
+            board, score, draws = self.apply(board, score, current)
+            moves += 1
+        return board, score, draws, moves
+
+    def latest(self):
+        return self.state_at(self.length)
+
+
+class Journal:
+
+    def __init__(self, path, rules, checkpoint=256, sync_moves=32, sync_interval=1.0):
+        self.path = path
+        self.rules = rules
+        self.checkpoint_period = checkpoint          # moves between checkpoints
+        self.sync_moves = sync_moves                 # records per fsync
+        self.sync_interval = sync_interval           # seconds between fsyncs
+        self.position = 0                            # records appended so far
+        self.queue = queue.Queue()                   # work for the writer thread
+        self.thread = threading.Thread(target=self.write, daemon=True)
+        self.thread.start()
+
+    def restore(self):
+        # latest (board, score, seed, draws, moves) of the journal, None if there is nothing to resume
+        replay = Replay(self.path, self.rules)
+        if not replay.positions:
+            return None
+        self.position = replay.length
+        self.queue.put(("truncate", replay.length * RECORD.size))
+        board, score, draws, moves = replay.latest()
+        return board, score, replay.seed, draws, moves
+
+    def start(self, board, score, seed, draws, moves=0):
+        # begin a new journal from this board
+        self.position = 0
+        self.queue.put(("reset", HEADER.pack(MAGIC, self.rules.grid, seed)))
+        self.checkpoint(board, score, draws, moves)
+
+    def checkpoint(self, board, score, draws, moves):
+        # 'moves' counts the moves of the game that led to this board, undone ones excluded
+        self.queue.put(("checkpoint", CHECKPOINT.pack(self.position, score, draws, moves) +
+                        bytes(self.rules.unpack(board))))
+
+    def append(self, direction, index, exponent, board, score, draws, moves):
+        # 'draws' is the generator position after the spawn, 'moves' the game's count with this one
+        self.queue.put(("record", RECORD.pack(direction, exponent, index, draws)))
+        self.position += 1
+        if self.position % self.checkpoint_period == 0:
+            self.checkpoint(board, score, draws, moves)
+
+    def sync(self):
+        # block until everything appended so far is on disk
+        done = threading.Event()
+        self.queue.put(("sync", done))
+        done.wait()
+
+    def close(self):
+        self.queue.put(("close", None))
+        self.thread.join()
+
+    # writer thread
+
+    def write(self):
+        records = index = None
+        pending, written, last_sync = [], 0, time.monotonic()
+        while True:
+            # sleep until the next request, or until the pending writes are due
+            timeout = None
+            if written or pending:
+                timeout = max(0.0, last_sync + self.sync_interval - time.monotonic())
+            try:
+                kind, data = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, data = None, None
+            try:
+                if records is None and kind not in ("close", None):
+                    records = open(self.path, "ab")
+                    index = open(self.path + ".idx", "ab")
+                if kind == "reset":
+                    records.truncate(0)
+                    index.truncate(0)
+                    index.write(data)
+                    pending = []
+                elif kind == "truncate":
+                    # drop a torn record left by a crash
+                    records.truncate(data)
+                elif kind == "record":
+                    records.write(data)
+                    written += 1
+                elif kind == "checkpoint":
+                    pending.append(data)
+                due = (written or pending) and time.monotonic() - last_sync >= self.sync_interval
+                if records is not None and (kind in ("sync", "close") or written >= self.sync_moves or due):
+                    self.flush(records, index, pending)
+                    pending, written, last_sync = [], 0, time.monotonic()
+            except OSError as error:
+                sys.stderr.write("journal: %s\n" % error)
+                last_sync = time.monotonic()         # retry after an interval, not in a loop
+            if kind == "sync":
+                data.set()
+            elif kind == "close":
+                if records is not None:
+                    records.close()
+                    index.close()
+                return
+
+    @staticmethod
+    def flush(records, index, pending):
+        # records reach the disk before the checkpoints that refer to them
+        records.flush()
+        os.fsync(records.fileno())
+        if pending:
+            index.write(b"".join(pending))
+        index.flush()
+        os.fsync(index.fileno())
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Game sessions over a local socket for bots. Every request is one JSON
+# line with an 'op' and an optional 'id' that is echoed in the answer:
+#
+#     {"id": 1, "op": "new", "grid": 4, "seed": 42}
+#     {"id": 2, "op": "move", "session": 1, "direction": "left"}
+#     {"id": 3, "op": "moves", "session": 1, "directions": "lurd"}
+#     {"id": 4, "op": "board", "session": 1}
+#     {"id": 5, "op": "hint", "session": 1, "depth": 2}
+#     {"id": 6, "op": "watch", "session": 1}
+#     {"id": 7, "op": "close", "session": 1}
+#
+# Answers carry "ok" and either the session state (with its "legal"
+# directions) or an "error". A session is a packed board, its score, moves
+# count and a seeded generator, moves follow the same rules as the window.
+# Watchers get the latest state of a session pushed at most 30 times a
+# second, however fast it is played.
+
+
+# import standard
+import os
+import sys
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# import local
+import ai
+import config
+import engine
+
+NAMES = {"left": engine.LEFT, "right": engine.RIGHT, "up": engine.UP, "down": engine.DOWN,
+         "l": engine.LEFT, "r": engine.RIGHT, "u": engine.UP, "d": engine.DOWN}
+WATCH_INTERVAL = 1 / 30.0                            # seconds between pushes to watchers
+MIN_GRID, MAX_GRID = 4, 64                           # grids a session may ask for
+
+
+class RequestError(Exception):
+    pass
+
+
+def parse_address(text):
+    # 'host:port' for TCP, anything else is a Unix socket path
+    host, separator, port = text.rpartition(":")
+    if separator and port.isdigit() and "/" not in text:
+        return host or "127.0.0.1", int(port)
+    return text
+
+
+def direction(value):
+    if isinstance(value, int) and value in engine.DIRECTIONS:
+        return value
+    if isinstance(value, str) and value.lower() in NAMES:
+        return NAMES[value.lower()]
+    raise RequestError("unknown direction %r" % (value,))
+
+
+class Session:
+
+    __slots__ = ("rules", "board", "score", "moves", "rng", "watchers")
+
+    def __init__(self, rules, seed=None):
+        self.rules = rules                           # shared move tables
+        self.board = 0                               # packed exponents
+        self.score = 0
+        self.moves = 0                               # applied moves
+        self.rng = engine.GameRandom(seed)           # spawn randomness
+        self.watchers = ()                           # writers of spectators
+        self.spawn()
+
+    def spawn(self):
+        self.board = self.rules.spawn(self.board, self.rng)[0]
+
+    def move(self, direction):
+        # the window's turn: move, then spawn when the board changed
+        board, gained = self.rules.move(self.board, direction)
+        if board == self.board:
+            return None
+        self.board = board
+        self.score += gained
+        self.moves += 1
+        self.spawn()
+        return gained
+
+    def state(self, number):
+        rules = self.rules
+        legal, won = rules.check(self.board)
+        return {"session": number,
+                "grid": rules.grid,
+                "board": rules.to_values(self.board),
+                "score": self.score,
+                "moves": self.moves,
+                "seed": self.rng.seed,
+                "legal": sorted(legal),
+                "won": won,
+                "over": not legal}
+
+
+class Server:
+
+    def __init__(self, grid=4, limit=100000):
+        self.grid = grid                             # grid of sessions that do not name one
+        self.limit = limit                           # most open sessions
+        self.sessions = {}                           # number -> Session
+        self.next_number = 1
+        self.dirty = set()                           # watched sessions changed since the last push
+        self.pushing = False                         # a push is scheduled
+        self.searchers = {}                          # grid -> ai.Searcher, used by one thread only
+        self.executor = ThreadPoolExecutor(1)        # hints run off the event loop
+        self.operations = {"new": self.new, "move": self.move, "moves": self.moves, "board": self.board,
+                           "hint": self.hint, "watch": self.watch, "close": self.close}
+
+    def session(self, request):
+        number = request.get("session")
+        if not isinstance(number, int) or number not in self.sessions:
+            raise RequestError("unknown session %r" % (number,))
+        return number, self.sessions[number]
+
+    def changed(self, number, session):
+        if session.watchers:
+            self.dirty.add(number)
+            if not self.pushing:
+                self.pushing = True
+                asyncio.get_running_loop().call_later(WATCH_INTERVAL, self.push)
+
+    def push(self):
+        self.pushing = False
+        for number in self.dirty:
+            session = self.sessions.get(number)
+            if session is None:
+                continue
+            line = (json.dumps(dict(session.state(number), ok=True, event="board")) + "\n").encode()
+            for writer in session.watchers:
+                if not writer.is_closing():
+                    writer.write(line)
+        self.dirty.clear()
+
+    # operations: (request, writer) -> answer fields
+
+    def new(self, request, writer):
+        if len(self.sessions) >= self.limit:
+            raise RequestError("too many sessions")
+        grid = request.get("grid", self.grid)
+        if not isinstance(grid, int) or not MIN_GRID <= grid <= MAX_GRID:
+            raise RequestError("grid must be %d-%d" % (MIN_GRID, MAX_GRID))
+        seed = request.get("seed")
+        if seed is not None and (not isinstance(seed, int) or not 0 <= seed <= engine.MASK64):
+            raise RequestError("bad seed %r" % (seed,))
+        number, self.next_number = self.next_number, self.next_number + 1
+        session = self.sessions[number] = Session(engine.Rules.for_grid(grid, compact=False), seed)
+        return session.state(number)
+
+    def move(self, request, writer):
+        number, session = self.session(request)
+        gained = session.move(direction(request.get("direction")))
+        if gained is not None:
+            self.changed(number, session)
+        return dict(session.state(number), moved=gained is not None, gained=gained or 0)
+
+    def moves(self, request, writer):
+        # many moves in one call; stops early once the game is over
+        number, session = self.session(request)
+        directions = request.get("directions")
+        if not isinstance(directions, (str, list)):
+            raise RequestError("directions must be a string or a list")
+        # a bad direction rejects the whole batch before anything moves
+        directions = [direction(value) for value in directions]
+        applied = gained = 0
+        rules = session.rules
+        for value in directions:
+            score = session.move(value)
+            if score is not None:
+                applied += 1
+                gained += score
+            elif not rules.can_move(session.board):
+                break
+        if applied:
+            self.changed(number, session)
+        return dict(session.state(number), applied=applied, gained=gained)
+
+    def board(self, request, writer):
+        number, session = self.session(request)
+        return session.state(number)
+
+    async def hint(self, request, writer):
+        number, session = self.session(request)
+        depth = request.get("depth", 2)
+        if not isinstance(depth, int) or not 1 <= depth <= 8:
+            raise RequestError("depth must be 1-8")
+        grid, board = session.rules.grid, session.board
+        if grid not in self.searchers:
+            self.searchers[grid] = ai.Searcher(grid, compact=False)
+        decision = await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: self.searchers[grid].decide(board, depth=depth))
+        return {"session": number, "direction": decision.direction, "depth": decision.depth,
+                "nodes": decision.nodes}
+
+    def watch(self, request, writer):
+        number, session = self.session(request)
+        if writer not in session.watchers:
+            session.watchers += (writer,)
+        return session.state(number)
+
+    def close(self, request, writer):
+        number, session = self.session(request)
+        del self.sessions[number]
+        self.dirty.discard(number)
+        return {"session": number}
+
+    def forget(self, writer):
+        # a connection went away, stop pushing to it
+        for session in self.sessions.values():
+            if writer in session.watchers:
+                session.watchers = tuple(watcher for watcher in session.watchers if watcher is not writer)
+
+    async def answer(self, line, writer):
+        answer = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("request must be an object")
+            answer["id"] = request.get("id")
+            operation = self.operations.get(request.get("op"))
+            if operation is None:
+                raise RequestError("unknown op %r" % (request.get("op"),))
+            res = operation(request, writer)
+            if asyncio.iscoroutine(res):
+                res = await res
+            answer.update(res)
+            answer["ok"] = True
+        except ValueError as error:
+            answer.update(ok=False, error="bad json: %s" % error)
+        except RequestError as error:
+            answer.update(ok=False, error=str(error))
+        except Exception as error:
+            # a request the checks above missed must not drop the connection
+            answer.update(ok=False, error="internal error: %s" % error)
+        return (json.dumps(answer) + "\n").encode()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(await self.answer(line, writer))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.forget(writer)
+            writer.close()
+
+    async def serve(self, address):
+        if isinstance(address, tuple):
+            server = await asyncio.start_server(self.handle, *address)
+        else:
+            if os.path.exists(address):
+                os.unlink(address)
+            server = await asyncio.start_unix_server(self.handle, address)
+        sys.stderr.write("serving on %s\n" % (address,))
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv):
+    settings = config.Settings('settings.ini')
+    parser = argparse.ArgumentParser(description="2048 sessions over a local socket")
+    parser.add_argument("--listen", metavar="ADDRESS", default=settings.server_address,
+                        help="host:port for TCP or a Unix socket path (default %(default)s)")
+    parser.add_argument("--grid", type=int, default=settings.grid, help="grid of new sessions")
+    parser.add_argument("--limit", type=int, default=100000, help="most open sessions")
+    args = parser.parse_args(argv)
+    if not MIN_GRID <= args.grid <= MAX_GRID:
+        parser.error("--grid must be %d-%d" % (MIN_GRID, MAX_GRID))
+    try:
+        asyncio.run(Server(args.grid, args.limit).serve(parse_address(args.listen)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
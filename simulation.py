@@ -0,0 +1,169 @@
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Headless batch play. Every game gets its own seed derived from the base
+# seed and the game number, so a run gives the same games whatever the
+# number of workers is.
+
+
+# import standard
+import sys
+import json
+import time
+import random
+import multiprocessing
+
+# import local
+import ai
+import engine
+import stats
+
+# expectimax searchers of this process by grid resolution
+_searchers = {}
+
+
+def game_seed(seed, index):
+    return "%s:%s" % (seed, index)
+
+
+# policies: (rules, board, legal moves, rng) -> direction
+
+def random_policy(rules, board, legal, rng):
+    return rng.choice(sorted(legal))
+
+
+def greedy_policy(rules, board, legal, rng):
+    # best immediate score, then most empty cells
+    def rank(direction):
+        moved, score = legal[direction]
+        return score, len(rules.empty_cells(moved))
+    return max(sorted(legal), key=rank)
+
+
+def expectimax_policy(rules, board, legal, rng, depth=2):
+    # fixed depth instead of a time budget keeps simulated games reproducible
+    if rules.grid not in _searchers:
+        _searchers[rules.grid] = ai.Searcher(rules.grid, compact=False)
+    return _searchers[rules.grid].decide(board, depth=depth).direction
+
+
+POLICIES = {"random": random_policy,
+            "greedy": greedy_policy,
+            "expectimax": expectimax_policy}
+
+
+def legal_moves(rules, board):
+    res = {}
+    for direction in engine.DIRECTIONS:
+        moved, score = rules.move(board, direction)
+        if moved != board:
+            res[direction] = (moved, score)
+    return res
+
+
+def play(task):
+    grid, policy, seed, index = task
+    start_time = time.perf_counter()
+    # the wide-cell rules of the window, so a 4x4 game is not stopped at 2^15
+    game = engine.Engine(grid, random.Random(game_seed(seed, index)), compact=False)
+    rng = random.Random(game_seed(seed, index) + ":policy")
+    choose = POLICIES[policy]
+    rules = game.rules
+    # searches must not see positions cached by the previous game of this worker
+    for searcher in _searchers.values():
+        searcher.cache.clear()
+    game.spawn()
+    while True:
+        legal = legal_moves(rules, game.board)
+        if not legal:
+            break
+        game.move(choose(rules, game.board, legal, rng))
+        game.spawn()
+    return {"game": index,
+            "score": game.score,
+            "max_tile": engine.exponent_to_value(rules.max_exponent(game.board)),
+            "moves": game.moves,
+            "seed": game_seed(seed, index),
+            "duration": time.perf_counter() - start_time}
+
+
+def prepare(grid):
+    engine.Rules.for_grid(grid, compact=False).precompute()
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Stats:
+
+    def __init__(self):
+        self.scores = []                             # final scores
+        self.tiles = {}                              # max tile -> games count
+        self.moves = 0                               # moves over all games
+        self.start_time = time.perf_counter()
+
+    def add(self, result):
+        self.scores.append(result["score"])
+        self.tiles[result["max_tile"]] = self.tiles.get(result["max_tile"], 0) + 1
+        self.moves += result["moves"]
+
+    def summary(self, final=False):
+        elapsed = time.perf_counter() - self.start_time
+        ordered = sorted(self.scores)
+        return {"games": len(ordered),
+                "final": final,
+                "score": {"mean": sum(ordered) / len(ordered) if ordered else 0,
+                          "min": ordered[0] if ordered else 0,
+                          "p50": percentile(ordered, 0.5),
+                          "p90": percentile(ordered, 0.9),
+                          "p99": percentile(ordered, 0.99),
+                          "max": ordered[-1] if ordered else 0},
+                "max_tile": {str(tile): self.tiles[tile] for tile in sorted(self.tiles)},
+                "moves": self.moves,
+                "moves_per_sec": self.moves / elapsed if elapsed else 0,
+                "elapsed": elapsed}
+
+
+def run(games, policy="random", workers=1, grid=4, seed=0, report=0, out=sys.stdout, store=None):
+    # 'store' is a stats.Store that gets every finished game
+    totals = Stats()
+    report = report or max(1, games // 10)
+    tasks = [(grid, policy, seed, index) for index in range(games)]
+
+    def emit(final=False):
+        out.write(json.dumps(totals.summary(final)) + "\n")
+        out.flush()
+
+    def add(result):
+        totals.add(result)
+        if store:
+            store.record(stats.game(grid, result["seed"], result["score"], result["max_tile"], result["moves"],
+                                    result["duration"], "simulation", "lost"))
+
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=prepare, initargs=(grid,)) as pool:
+            for result in pool.imap_unordered(play, tasks, chunksize=max(1, min(64, games // (workers * 8)))):
+                add(result)
+                if len(totals.scores) % report == 0 and len(totals.scores) < games:
+                    emit()
+    else:
+        prepare(grid)
+        for task in tasks:
+            add(play(task))
+            if len(totals.scores) % report == 0 and len(totals.scores) < games:
+                emit()
+    emit(True)
+    return totals
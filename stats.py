@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# The 2048 game implementation on PyQt5.
+# Copyright (C) 2019  Denys Ksenchuk <denny.ks359@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Finished games in a SQLite file. The window and simulations hand games
+# to a Store, whose thread owns the connection, inserts them in batches and
+# answers aggregate queries after the games queued before them are written.
+# Run this file to print the aggregates of a database as JSON.
+
+
+# import standard
+import sys
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from collections import namedtuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    finished REAL NOT NULL,
+    grid INTEGER NOT NULL,
+    seed TEXT,
+    score INTEGER NOT NULL,
+    max_tile INTEGER NOT NULL,
+    moves INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    moves_per_sec REAL NOT NULL,
+    source TEXT NOT NULL,
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_grid_score ON games (grid, score);
+CREATE INDEX IF NOT EXISTS games_grid_max_tile ON games (grid, max_tile);
+CREATE INDEX IF NOT EXISTS games_finished ON games (finished);
+"""
+
+INSERT = ("INSERT INTO games (finished, grid, seed, score, max_tile, moves, duration, moves_per_sec, source, outcome) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+# one finished game in column order; 'source' is "window" or "simulation",
+# 'outcome' is "lost" or "abandoned"
+Game = namedtuple("Game", "finished grid seed score max_tile moves duration moves_per_sec source outcome")
+
+
+def game(grid, seed, score, max_tile, moves, duration, source, outcome):
+    return Game(time.time(), grid, str(seed), score, max_tile, moves, duration,
+                moves / duration if duration else 0.0, source, outcome)
+
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def summary(connection, grid=None, source=None):
+    # aggregates in the shape of simulation.Stats.summary
+    conditions, parameters = [], []
+    if grid is not None:
+        conditions.append("grid = ?")
+        parameters.append(grid)
+    if source is not None:
+        conditions.append("source = ?")
+        parameters.append(source)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    count, mean, best, speed = connection.execute(
+        "SELECT COUNT(*), AVG(score), MAX(score), AVG(moves_per_sec) FROM games" + where, parameters).fetchone()
+
+    def percentile(fraction):
+        # same pick as simulation.percentile, walked along the score index
+        if not count:
+            return 0
+        return connection.execute("SELECT score FROM games" + where + " ORDER BY score LIMIT 1 OFFSET ?",
+                                  parameters + [min(count - 1, int(fraction * count))]).fetchone()[0]
+
+    tiles = connection.execute("SELECT max_tile, COUNT(*) FROM games" + where + " GROUP BY max_tile ORDER BY max_tile",
+                               parameters).fetchall()
+    return {"games": count,
+            "score": {"mean": mean or 0,
+                      "p50": percentile(0.5),
+                      "p90": percentile(0.9),
+                      "p99": percentile(0.99),
+                      "max": best or 0},
+            "max_tile": {str(tile): games for tile, games in tiles},
+            "moves_per_sec": speed or 0}
+
+
+class Store:
+
+    def __init__(self, path, batch=64, interval=1.0):
+        self.path = path
+        self.batch = batch                           # games per insert transaction
+        self.interval = interval                     # seconds a queued game may wait
+        self.queue = queue.Queue()                   # work for the writer thread
+        self.thread = threading.Thread(target=self.write, daemon=True)
+        self.thread.start()
+
+    def record(self, game):
+        self.queue.put(("record", game))
+
+    def query(self, callback, grid=None, source=None):
+        # 'callback' gets the summary on the writer thread
+        self.queue.put(("query", (callback, grid, source)))
+
+    def close(self):
+        self.queue.put(("close", None))
+        self.thread.join()
+
+    # writer thread
+
+    def write(self):
+        connection = None
+        pending = []
+        while True:
+            try:
+                kind, data = self.queue.get(timeout=self.interval if pending else None)
+            except queue.Empty:
+                kind, data = None, None
+            try:
+                if connection is None and kind != "close":
+                    connection = connect(self.path)
+                if kind == "record":
+                    pending.append(data)
+                if pending and (kind != "record" or len(pending) >= self.batch):
+                    with connection:
+                        connection.executemany(INSERT, pending)
+                    pending = []
+                if kind == "query":
+                    callback, grid, source = data
+                    callback(summary(connection, grid, source))
+            except sqlite3.Error as error:
+                sys.stderr.write("stats: %s\n" % error)
+                pending = []
+            if kind == "close":
+                if connection is not None:
+                    connection.close()
+                return
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="aggregates of recorded 2048 games")
+    parser.add_argument("--db", default="stats.db", help="database file (default %(default)s)")
+    parser.add_argument("--grid", type=int, help="only games of this grid")
+    parser.add_argument("--source", choices=("window", "simulation"), help="only games from this source")
+    args = parser.parse_args(argv)
+    connection = connect(args.db)
+    try:
+        print(json.dumps(summary(connection, args.grid, args.source)))
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))